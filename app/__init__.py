@@ -23,6 +23,9 @@ def create_app(config_class=Config):
     login.init_app(app)
     moment.init_app(app)
 
+    from app.uploads import uploads
+    uploads.init_app(app)
+
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
 
@@ -32,8 +35,9 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
-    if not os.path.exists(app.config['UPLOAD_PATH']):
-        os.mkdir(app.config['UPLOAD_PATH'])
+    for folder in ('EXPORT_PATH', 'EXPORT_CACHE_PATH', 'THUMBNAIL_PATH'):
+        if not os.path.exists(app.config[folder]):
+            os.mkdir(app.config[folder])
         
     if not app.debug and not app.testing:
         if not os.path.exists('logs'):
@@ -0,0 +1,33 @@
+"""Helpers shared by the work the app runs off the request thread"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+import threading
+
+
+class LazyExecutor:
+    """
+    A thread pool created on first use, so importing a module starts no threads
+
+    max_workers is a number, or a callable returning one when the pool is
+    created (for instance from the app config). Work still queued when the
+    interpreter exits is run before it does.
+    """
+
+    def __init__(self, thread_name_prefix, max_workers=1):
+        self.thread_name_prefix = thread_name_prefix
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._executor is None:
+                max_workers = self.max_workers() if callable(self.max_workers) else self.max_workers
+                self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                                    thread_name_prefix=self.thread_name_prefix)
+        return self._executor.submit(fn, *args, **kwargs)
+
+
+def utc(moment):
+    """moment as an aware UTC datetime; SQLite hands back naive datetimes, stored in UTC"""
+    return moment.replace(tzinfo=timezone.utc) if moment is not None and moment.tzinfo is None else moment
@@ -0,0 +1,32 @@
+"""Group capacity kept exact under concurrent submissions and deletions"""
+import sqlalchemy as sa
+from app import db
+from app.models import Group
+
+
+def reserve_group_slot(group_id):
+    """
+    Count one more submission towards a group, unless it is already full
+
+    A single conditional UPDATE, so the check and the increment cannot be
+    split by another request. It runs in the caller's transaction: a rollback
+    gives the slot back. Returns whether a slot was reserved.
+    """
+    reserved = db.session.execute(
+        sa.update(Group)
+        .where(Group.id == group_id)
+        .where(sa.or_(Group.max_capacity == 0, Group.current_count < Group.max_capacity))
+        .values(current_count=Group.current_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return reserved == 1
+
+
+def release_group_slots(group_id, count=1):
+    """Count `count` fewer submissions towards a group, never going below zero, in the caller's transaction"""
+    db.session.execute(
+        sa.update(Group)
+        .where(Group.id == group_id)
+        .values(current_count=sa.case((Group.current_count > count, Group.current_count - count), else_=0))
+        .execution_options(synchronize_session=False)
+    )
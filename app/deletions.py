@@ -0,0 +1,106 @@
+"""Set-based deletion of submissions, with their files removed in the background"""
+from collections import Counter
+import os
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.background import LazyExecutor
+from app.models import Form, FormTombstone, Group, Link
+from app.images import thumbnail_file
+from app.uploads import uploads
+from app.export_cache import invalidate_group_exports
+from app.capacity import release_group_slots
+
+BATCH_SIZE = 500  # Ids per IN (...) list, well under every database's parameter limit
+
+# One thread, so a large deletion never competes with requests for storage
+_executor = LazyExecutor('file-deleter')
+
+
+def delete_forms(user, form_ids=(), link_ids=(), group_id=None):
+    """
+    Delete a user's submissions by form id, by link (deleting the links too) or a whole group's
+
+    The forms are read with one projected query per batch of ids and removed
+    with DELETE ... WHERE id IN (...). Each group's current_count is adjusted
+    once, tombstones are written for incremental exports, and releasing the
+    photos is left to a background thread once the deletion is committed.
+    Ids the user does not own are ignored.
+
+    Returns:
+        (forms deleted, links deleted)
+    """
+    owned_groups = sa.select(Group.id).where(Group.user_id == user.id)
+    owned_forms = sa.or_(
+        Form.group_id.in_(owned_groups),
+        Form.group_id.is_(None) & Form.link_id.in_(sa.select(Link.id).where(Link.user_id == user.id)),
+    )
+    selections = [Form.id.in_(batch) for batch in _batches(form_ids)] + \
+        [Form.link_id.in_(batch) for batch in _batches(link_ids)]
+    if group_id is not None:
+        selections.append(Form.group_id == group_id)
+
+    forms = []
+    for selection in selections:
+        forms.extend(db.session.execute(
+            sa.select(Form.id, Form.group_id, Form.image_hash, Form.image_original_hash)
+            .where(selection, owned_forms)
+        ).all())
+    forms = list({form.id: form for form in forms}.values())
+
+    if forms:
+        tombstones = [{'form_id': form.id, 'group_id': form.group_id} for form in forms if form.group_id]
+        if tombstones:
+            db.session.execute(sa.insert(FormTombstone), tombstones)
+        for batch in _batches([form.id for form in forms]):
+            db.session.execute(sa.delete(Form).where(Form.id.in_(batch)).execution_options(synchronize_session=False))
+    deleted_per_group = Counter(form.group_id for form in forms if form.group_id)
+    for counted_group_id, deleted in deleted_per_group.items():
+        release_group_slots(counted_group_id, deleted)
+
+    links_deleted = 0
+    owned_links = (Link.user_id == user.id) | Link.group_id.in_(owned_groups)
+    for batch in _batches(link_ids):
+        links_deleted += db.session.execute(
+            sa.delete(Link).where(Link.id.in_(batch), owned_links).execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+    # The bulk statements bypassed the session; reload anything it still holds
+    db.session.expire_all()
+
+    for counted_group_id in deleted_per_group:
+        invalidate_group_exports(counted_group_id)
+    if forms:
+        remove_files([(form.id, form.image_hash, form.image_original_hash) for form in forms])
+    return len(forms), links_deleted
+
+
+def remove_files(photos):
+    """
+    Release deleted forms' photos and their cached spreadsheet thumbnails in the background
+
+    photos are (form_id, image_hash, original_hash) tuples of committed
+    deletions. Files left behind if the process stops first are swept up by
+    gc_uploads.py.
+    """
+    _executor.submit(_remove_files, current_app._get_current_object(), photos)
+
+
+def _remove_files(app, photos):
+    with app.app_context():
+        try:
+            uploads.release_many(photos)
+            for form_id, _, _ in photos:
+                path = thumbnail_file(app.config['THUMBNAIL_PATH'], form_id, app.config['EXPORT_THUMBNAIL_SIZE'])
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception:
+            app.logger.exception('Removing the files of %d deleted forms failed', len(photos))
+        finally:
+            db.session.remove()
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
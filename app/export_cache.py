@@ -0,0 +1,110 @@
+"""On-disk cache of built group exports, keyed by the group's content version"""
+import os
+import shutil
+import uuid
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.models import Form
+from app.export_utils import EXPORT_KINDS
+
+
+def group_version(group_id):
+    """
+    A string that changes whenever a submission is added to or removed from the group, or its photo is replaced
+
+    Built from the submission count, the newest submitted_at and the newest
+    image_updated_at (set when a photo is normalized), all answered from the
+    form indexes without reading any rows.
+    """
+    count, latest, updated = db.session.execute(
+        sa.select(sa.func.count(Form.id), sa.func.max(Form.submitted_at), sa.func.max(Form.image_updated_at))
+        .where(Form.group_id == group_id)
+    ).one()
+    stamps = [moment.strftime('%Y%m%d%H%M%S%f') if moment else '0' for moment in (latest, updated)]
+    return '-'.join([str(count)] + stamps)
+
+
+def cached_export(group_id, kind, version):
+    """Path of the cached export, or None on a miss. A hit counts as a use for LRU eviction."""
+    path = _cache_path(group_id, kind, version)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def cache_export_stream(group_id, kind, version, chunks):
+    """
+    Pass chunks through while also writing them to the cache
+
+    The entry only becomes visible once every chunk has been written, so an
+    interrupted download never leaves a truncated export behind.
+    """
+    path = _cache_path(group_id, kind, version)
+    partial = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        with open(partial, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    _enforce_size_limit()
+
+
+def store_export(group_id, kind, version, source):
+    """Copy a finished export file into the cache and return the cached path"""
+    path = _cache_path(group_id, kind, version)
+    partial = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, path)
+    _enforce_size_limit()
+    return path
+
+
+def invalidate_group_exports(group_id):
+    """Drop every cached export of a group"""
+    prefix = f'{group_id}-'
+    for entry in os.scandir(current_app.config['EXPORT_CACHE_PATH']):
+        if entry.name.startswith(prefix) and not entry.name.endswith('.part'):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def _cache_path(group_id, kind, version):
+    extension = EXPORT_KINDS[kind][0]
+    return os.path.join(current_app.config['EXPORT_CACHE_PATH'], f'{group_id}-{kind}-{version}.{extension}')
+
+
+def _enforce_size_limit():
+    """Evict the least recently used exports until the cache fits EXPORT_CACHE_MAX_BYTES"""
+    entries = []
+    total = 0
+    for entry in os.scandir(current_app.config['EXPORT_CACHE_PATH']):
+        if entry.name.endswith('.part'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    limit = current_app.config['EXPORT_CACHE_MAX_BYTES']
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
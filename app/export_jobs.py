@@ -0,0 +1,176 @@
+"""Background export jobs that write group exports to disk"""
+from datetime import datetime, timezone
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.background import LazyExecutor
+from app.models import Form, Group
+from app.export_utils import stream_group_export, iter_group_forms, stream_group_photos, \
+    photo_export_rows, iter_group_records, RECORD_WRITERS, EXPORT_KINDS, stream_group_export_with_photos
+from app.images import process_pool
+from app.uploads import uploads
+from app.export_cache import group_version, cached_export, store_export
+
+_JOB_ID = re.compile(r'[A-Za-z0-9_-]{22}')
+_executor = LazyExecutor('export-job', lambda: current_app.config['EXPORT_JOB_WORKERS'])
+
+
+def submit_export_job(group, kind, user_id):
+    """
+    Queue an export of a group and return the new job's status
+
+    The job runs on a thread pool shared by the process; its status and
+    artifact are kept as files in EXPORT_PATH so any worker can serve them.
+    """
+    extension, mimetype, suffix = EXPORT_KINDS[kind]
+    export_path = current_app.config['EXPORT_PATH']
+    _prune_jobs(export_path, current_app.config['EXPORT_JOB_TTL'].total_seconds())
+
+    job = {
+        'id': secrets.token_urlsafe(16),
+        'kind': kind,
+        'group_id': group.id,
+        'user_id': user_id,
+        'status': 'queued',
+        'rows_done': 0,
+        'rows_total': None,
+        'photos_done': 0,
+        'photos_total': None,
+        'mimetype': mimetype,
+        'download_name': f"{group.name.replace(' ', '_')}_{suffix}.{extension}",
+        'error': None,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'finished_at': None,
+    }
+    _save_job(export_path, job)
+    _executor.submit(_run_job, current_app._get_current_object(), dict(job))
+    return job
+
+
+def get_export_job(job_id):
+    """Load a job's status, or None if the id is unknown"""
+    if not _JOB_ID.fullmatch(job_id):
+        return None
+    try:
+        with open(_status_path(current_app.config['EXPORT_PATH'], job_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def export_job_artifact(job):
+    """Path of a finished job's export file"""
+    extension = EXPORT_KINDS[job['kind']][0]
+    return os.path.join(current_app.config['EXPORT_PATH'], f"{job['id']}.{extension}")
+
+
+def _run_job(app, job):
+    with app.app_context():
+        export_path = app.config['EXPORT_PATH']
+        artifact = export_job_artifact(job)
+        partial = artifact + '.part'
+        tracker = _ProgressTracker(export_path, job)
+        try:
+            job['status'] = 'running'
+            group = db.session.get(Group, job['group_id'])
+            version = group_version(group.id)
+            cached = cached_export(group.id, job['kind'], version)
+            progress = 'photos' if job['kind'] == 'photos' else 'rows'
+            job[f'{progress}_total'] = db.session.scalar(
+                sa.select(sa.func.count(Form.id)).where(Form.group_id == group.id)
+            )
+
+            if cached:
+                shutil.copyfile(cached, partial)
+                # The cached file is the whole export, so every row (or photo) is done at once
+                job[f'{progress}_done'] = job[f'{progress}_total']
+            else:
+                if job['kind'] == 'photos':
+                    forms = photo_export_rows(group.id)
+                    chunks = stream_group_photos(forms, uploads,
+                                                 app.config['EXPORT_READAHEAD'], progress=tracker.photos)
+                elif job['kind'] == 'xlsx':
+                    forms = iter_group_forms(group.id, app.config['EXPORT_BATCH_SIZE'])
+                    chunks = stream_group_export(group, forms, progress=tracker.rows)
+                elif job['kind'] == 'xlsx_photos':
+                    forms = iter_group_forms(group.id, app.config['EXPORT_BATCH_SIZE'])
+                    chunks = stream_group_export_with_photos(
+                        group, forms, uploads, app.config['THUMBNAIL_PATH'],
+                        app.config['EXPORT_THUMBNAIL_SIZE'], process_pool(app.config['IMAGE_WORKERS']),
+                        progress=tracker.rows
+                    )
+                else:
+                    rows = iter_group_records(group.id, app.config['EXPORT_BATCH_SIZE'])
+                    chunks = RECORD_WRITERS[job['kind']](rows, progress=tracker.rows)
+                _save_job(export_path, job)
+
+                with open(partial, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                store_export(group.id, job['kind'], version, partial)
+
+            os.replace(partial, artifact)
+            job['status'] = 'done'
+        except Exception as exc:
+            app.logger.exception('Export job %s failed', job['id'])
+            job['status'] = 'failed'
+            job['error'] = str(exc)
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            db.session.remove()
+
+        job['finished_at'] = datetime.now(timezone.utc).isoformat()
+        _save_job(export_path, job)
+
+
+class _ProgressTracker:
+    """Records progress on the job, writing the status file at most twice a second"""
+
+    def __init__(self, export_path, job, interval=0.5):
+        self._export_path = export_path
+        self._job = job
+        self._interval = interval
+        self._last_saved = 0.0
+
+    def rows(self, done):
+        self._update('rows_done', done)
+
+    def photos(self, done):
+        self._update('photos_done', done)
+
+    def _update(self, field, done):
+        self._job[field] = done
+        now = time.monotonic()
+        if now - self._last_saved >= self._interval:
+            self._last_saved = now
+            _save_job(self._export_path, self._job)
+
+
+def _status_path(export_path, job_id):
+    return os.path.join(export_path, f'{job_id}.json')
+
+
+def _save_job(export_path, job):
+    # Write then rename so readers never see a half-written status file
+    path = _status_path(export_path, job['id'])
+    with open(path + '.tmp', 'w') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
+
+
+def _prune_jobs(export_path, max_age):
+    """Remove status files and artifacts older than max_age seconds"""
+    cutoff = time.time() - max_age
+    for entry in os.scandir(export_path):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -1,120 +1,888 @@
-"""Utilities for exporting group data to Excel"""
+"""Utilities for exporting group data to Excel, CSV and JSON Lines"""
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.drawing.image import Image as XLImage
 from io import BytesIO
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
+import base64
+import binascii
+import csv
+import io
+import json
+import queue
+import threading
+import zipfile
+import itertools
+import re
+import unicodedata
+from urllib.parse import quote
 from datetime import datetime
+from flask import Response, stream_with_context
+from werkzeug.datastructures import Headers
+import sqlalchemy as sa
+from app import db
+from app.models import Form, FormTombstone, Group
+from app.images import make_thumbnail, thumbnail_file
+from app.uploads import read_first
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# kind -> (file extension, mimetype, download name suffix)
+EXPORT_KINDS = {
+    'xlsx': ('xlsx', XLSX_MIMETYPE, 'submissions'),
+    'xlsx_photos': ('xlsx', XLSX_MIMETYPE, 'submissions_with_photos'),
+    'csv': ('csv', 'text/csv', 'submissions'),
+    'ndjson': ('ndjson', 'application/x-ndjson', 'submissions'),
+    'photos': ('zip', 'application/zip', 'photos'),
+}
+
+# Style objects are shared by every cell; openpyxl only needs one instance of each
+HEADER_FILL = PatternFill(start_color="FF7A00", end_color="FF7A00", fill_type="solid")
+HEADER_FONT = Font(bold=True, color="FFFFFF", size=12)
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+CENTER_ALIGNMENT = Alignment(horizontal='center')
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+# Every export format is built from this list. field is the Form attribute
+# (and the CSV/JSON key), kind decides how values are formatted, width and
+# centered only apply to the spreadsheet.
+ExportColumn = namedtuple('ExportColumn', ['header', 'field', 'kind', 'width', 'centered'])
+
+EXPORT_COLUMNS = [
+    ExportColumn('First Name', 'first_name', 'text', 15, False),
+    ExportColumn('Last Name', 'last_name', 'text', 15, False),
+    ExportColumn('Middle Name', 'middle_name', 'text', 15, False),
+    ExportColumn('Eye Color', 'eye_color', 'text', 12, False),
+    ExportColumn('Hair Color', 'hair_color', 'text', 12, False),
+    ExportColumn('Address', 'address', 'text', 25, False),
+    ExportColumn('Date of Birth', 'date_of_birth', 'date', 15, True),
+    ExportColumn('Height (cm)', 'height', 'number', 10, True),
+    ExportColumn('Weight (kg)', 'weight', 'number', 10, True),
+    ExportColumn('State', 'state', 'text', 8, False),
+    ExportColumn('City', 'city', 'text', 15, False),
+    ExportColumn('Zip Code', 'zip_code', 'text', 12, False),
+    ExportColumn('Gender', 'gender', 'text', 12, False),
+    ExportColumn('Organ Donor', 'organ_donor', 'bool', 12, False),
+    ExportColumn('Corrective Lenses', 'restrictions_corrective_lenses', 'bool', 20, False),
+    ExportColumn('Submitted At', 'submitted_at', 'datetime', 20, False),
+]
+
+HEADERS = [column.header for column in EXPORT_COLUMNS]
+
+# Columns selected for the CSV and JSON Lines exports, which also carry the id
+RECORD_COLUMNS = [Form.id] + [getattr(Form, column.field) for column in EXPORT_COLUMNS]
+RECORD_FIELDS = ['id'] + [column.field for column in EXPORT_COLUMNS]
+RECORD_KINDS = ['text'] + [column.kind for column in EXPORT_COLUMNS]
+
+# A RECORD_COLUMNS row as a plain tuple, which can be sent to a worker process
+FormRecord = namedtuple('FormRecord', RECORD_FIELDS)
+
+# Incremental exports add the submission id so rows can be matched up downstream
+ID_HEADER = 'Submission ID'
+ID_COLUMN_WIDTH = 25
+
+# Position reached by an incremental export: the last (submitted_at, id) of the
+# forms sent and the last (deleted_at, id) of the tombstones sent
+ExportCursor = namedtuple('ExportCursor', ['forms', 'tombstones'])
+
+# Photo formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'jpg', 'jpe', 'jpeg', 'png', 'gif', 'webp'}
+
+# Columns the photo export reads; the extension was detected when the photo was uploaded
+PHOTO_COLUMNS = (Form.id, Form.first_name, Form.last_name, Form.submitted_at, Form.image_extension,
+                 Form.image_hash)
+
+
+def form_row(form):
+    """Return the spreadsheet cell values for a single form, in HEADERS order"""
+    return [_cell_value(getattr(form, column.field), column.kind) for column in EXPORT_COLUMNS]
+
+
+def _cell_value(value, kind):
+    if kind == 'bool':
+        return 'Yes' if value else 'No'
+    if value is None:
+        return ''
+    if kind == 'date':
+        return value.strftime('%Y-%m-%d')
+    if kind == 'datetime':
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _record_value(value, kind):
+    if value is None:
+        return None
+    if kind == 'date':
+        return value.strftime('%Y-%m-%d')
+    if kind == 'datetime':
+        return value.isoformat()
+    return value
+
+
+def iter_group_forms(group_id, batch_size=500):
+    """
+    Iterate over a group's forms, newest first, fetching batch_size rows at a time
+
+    Rows are not kept by the session once they go out of scope, so memory use
+    does not grow with the size of the group. The query only runs once
+    iteration starts, so a streamed response runs it in the session of its
+    own context: the view's session is closed by the time the body is sent.
+    """
+    query = (
+        sa.select(Form)
+        .where(Form.group_id == group_id)
+        .order_by(Form.submitted_at.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.session.scalars(query)
+
+
+def iter_group_records(group_id, batch_size=500):
+    """
+    Iterate over a group's forms as plain rows of RECORD_COLUMNS, newest first
+
+    Only the exported columns are selected and no ORM objects are built; rows
+    are fetched batch_size at a time from a server-side cursor. As with
+    iter_group_forms, the query only runs once iteration starts.
+    """
+    query = (
+        sa.select(*RECORD_COLUMNS)
+        .where(Form.group_id == group_id)
+        .order_by(Form.submitted_at.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.session.execute(query)
+
+
+def iter_user_group_records(user_id, batch_size=500):
+    """
+    Yield (group_id, group_name, records) for every group of a user that has submissions
+
+    A single query over Form joined to Group, ordered by group, is split into
+    one run of FormRecords per group; each run must be consumed before the next.
+    """
+    query = (
+        sa.select(Group.id, Group.name, *RECORD_COLUMNS)
+        .join(Group, Form.group_id == Group.id)
+        .where(Group.user_id == user_id)
+        .order_by(Group.created_at.desc(), Group.id, Form.submitted_at.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    rows = db.session.execute(query)
+    for (group_id, group_name), group_rows in itertools.groupby(rows, key=lambda row: (row[0], row[1])):
+        yield group_id, group_name, (FormRecord(*row[2:]) for row in group_rows)
+
+
+def stream_group_csv(rows, progress=None, chunk_size=64 * 1024):
+    """
+    Yield a CSV file with a header of RECORD_FIELDS and one line per row
+
+    Args:
+        rows: Iterable of rows of RECORD_COLUMNS, such as iter_group_records
+        progress: Optional callable, called with the number of rows written so far
+
+    Yields:
+        UTF-8 encoded chunks of the .csv file
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(RECORD_FIELDS)
+    for rows_done, row in enumerate(rows, 1):
+        writer.writerow([_record_value(value, kind) for value, kind in zip(row, RECORD_KINDS)])
+        if buffer.tell() >= chunk_size:
+            yield _take(buffer)
+        if progress:
+            progress(rows_done)
+    yield _take(buffer)
+
+
+def stream_group_ndjson(rows, progress=None, chunk_size=64 * 1024):
+    """
+    Yield one JSON object per row, keyed by RECORD_FIELDS, one per line
+
+    Args:
+        rows: Iterable of rows of RECORD_COLUMNS, such as iter_group_records
+        progress: Optional callable, called with the number of rows written so far
+
+    Yields:
+        UTF-8 encoded chunks of the .ndjson file
+    """
+    buffer = io.StringIO()
+    for rows_done, row in enumerate(rows, 1):
+        record = {field: _record_value(value, kind)
+                  for field, value, kind in zip(RECORD_FIELDS, row, RECORD_KINDS)}
+        buffer.write(json.dumps(record, separators=(',', ':')))
+        buffer.write('\n')
+        if buffer.tell() >= chunk_size:
+            yield _take(buffer)
+        if progress:
+            progress(rows_done)
+    yield _take(buffer)
+
+
+def _take(buffer):
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+# kind -> writer for the record-based formats
+RECORD_WRITERS = {
+    'csv': stream_group_csv,
+    'ndjson': stream_group_ndjson,
+}
 
 
 def create_group_export(group, forms):
     """
     Create an Excel workbook with group data and images
-    
+
     Args:
         group: Group object
         forms: List of Form objects
-    
+
     Returns:
         BytesIO object containing the Excel file
     """
     wb = Workbook()
     ws = wb.active
     ws.title = "Submissions"
-    
-    # Define styles
-    header_fill = PatternFill(start_color="FF7A00", end_color="FF7A00", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Set column widths
-    column_widths = {
-        'A': 15,  # First Name
-        'B': 15,  # Last Name
-        'C': 15,  # Middle Name
-        'D': 12,  # Eye Color
-        'E': 12,  # Hair Color
-        'F': 25,  # Address
-        'G': 15,  # Date of Birth
-        'H': 10,  # Height
-        'I': 10,  # Weight
-        'J': 8,   # State
-        'K': 15,  # City
-        'L': 12,  # Zip Code
-        'M': 12,  # Gender
-        'N': 12,  # Organ Donor
-        'O': 20,  # Corrective Lenses
-        'P': 20,  # Submitted At
-    }
-    
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
-    
+
+    for col_num, column in enumerate(EXPORT_COLUMNS, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = column.width
+
     # Create header row
-    headers = [
-        'First Name', 'Last Name', 'Middle Name', 'Eye Color', 'Hair Color',
-        'Address', 'Date of Birth', 'Height (cm)', 'Weight (kg)', 'State',
-        'City', 'Zip Code', 'Gender', 'Organ Donor', 'Corrective Lenses',
-        'Submitted At'
-    ]
-    
-    for col_num, header in enumerate(headers, 1):
+    for col_num, header in enumerate(HEADERS, 1):
         cell = ws.cell(row=1, column=col_num)
         cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-    
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = THIN_BORDER
+
     # Add data rows
     for row_num, form in enumerate(forms, 2):
-        row_data = [
-            form.first_name,
-            form.last_name,
-            form.middle_name or '',
-            form.eye_color,
-            form.hair_color,
-            form.address or '',
-            form.date_of_birth.strftime('%Y-%m-%d') if form.date_of_birth else '',
-            form.height,
-            form.weight,
-            form.state or '',
-            form.city or '',
-            form.zip_code or '',
-            form.gender,
-            'Yes' if form.organ_donor else 'No',
-            'Yes' if form.restrictions_corrective_lenses else 'No',
-            form.submitted_at.strftime('%Y-%m-%d %H:%M:%S') if form.submitted_at else '',
-        ]
-        
-        for col_num, value in enumerate(row_data, 1):
+        for col_num, (column, value) in enumerate(zip(EXPORT_COLUMNS, form_row(form)), 1):
             cell = ws.cell(row=row_num, column=col_num)
             cell.value = value
-            cell.border = border
-            if col_num in [7, 8, 9]:  # Center align numeric columns
-                cell.alignment = Alignment(horizontal='center')
-    
+            cell.border = THIN_BORDER
+            if column.centered:  # Center align numeric columns
+                cell.alignment = CENTER_ALIGNMENT
+
     # Create a BytesIO object to store the workbook
     output = BytesIO()
     wb.save(output)
     output.seek(0)
-    
+
     return output
 
 
+def stream_group_export(group, forms, progress=None):
+    """
+    Build the same workbook as create_group_export and yield it in chunks
+
+    Rows go to a write-only worksheet, which spools them to a temporary file
+    instead of keeping a cell object per value, so forms can be any iterable
+    (such as iter_group_forms) and peak memory stays flat.
+
+    Args:
+        group: Group object
+        forms: Iterable of Form objects
+        progress: Optional callable, called with the number of rows written so far
+
+    Yields:
+        bytes chunks of the .xlsx file
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Submissions")
+    write_submissions_sheet(ws, forms, progress)
+    yield from stream_workbook(wb)
+
+
+def write_submissions_sheet(ws, forms, progress=None, include_id=False, extra_headers=()):
+    """
+    Write the header and one row per form to a write-only worksheet
+
+    extra_headers are added after the last column, for columns the caller
+    fills in some other way (such as anchored images).
+    """
+    headers = (HEADERS + [ID_HEADER] if include_id else HEADERS) + list(extra_headers)
+    for col_num, column in enumerate(EXPORT_COLUMNS, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = column.width
+    if include_id:
+        ws.column_dimensions[get_column_letter(len(headers))].width = ID_COLUMN_WIDTH
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = THIN_BORDER
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for rows_done, form in enumerate(forms, 1):
+        row = []
+        for column, value in zip(EXPORT_COLUMNS, form_row(form)):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.border = THIN_BORDER
+            if column.centered:
+                cell.alignment = CENTER_ALIGNMENT
+            row.append(cell)
+        if include_id:
+            cell = WriteOnlyCell(ws, value=form.id)
+            cell.border = THIN_BORDER
+            row.append(cell)
+        ws.append(row)
+        if progress:
+            progress(rows_done)
+
+
+def stream_group_export_with_photos(group, forms, uploads, thumbnail_path, size=64,
+                                    pool=None, readahead=64, progress=None):
+    """
+    Like stream_group_export, with a thumbnail of each photo in an extra column
+
+    Thumbnails are made on a process pool, up to `readahead` forms ahead of
+    the row being written, and kept in thumbnail_path so later exports only
+    embed them. Forms whose photo is missing or unreadable get no image.
+
+    Args:
+        group: Group object
+        forms: Iterable of Form objects
+        uploads: UploadStore holding the photos
+        thumbnail_path: Directory where thumbnails are cached
+        size: Thumbnail bounding box in pixels
+        pool: Executor for making missing thumbnails (see app.images.process_pool);
+            without one they are made inline, one at a time
+        progress: Optional callable, called with the number of rows written so far
+
+    Yields:
+        bytes chunks of the .xlsx file
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Submissions")
+    photo_column = get_column_letter(len(HEADERS) + 1)
+    ws.column_dimensions[photo_column].width = size / 7 + 2  # ~7 pixels per character
+    ws.sheet_format.defaultRowHeight = size * 0.75 + 4  # rows are measured in points
+    ws.sheet_format.customHeight = True
+
+    def forms_with_images():
+        thumbnails = _thumbnails_ahead(pool, forms, uploads, thumbnail_path, size, readahead)
+        for row_num, (form, thumbnail) in enumerate(thumbnails, 2):
+            if thumbnail:
+                image = XLImage(thumbnail)
+                image.anchor = f'{photo_column}{row_num}'
+                ws.add_image(image)
+            yield form
+
+    write_submissions_sheet(ws, forms_with_images(), progress, extra_headers=['Photo'])
+    yield from stream_workbook(wb)
+
+
+def _thumbnails_ahead(pool, forms, uploads, thumbnail_path, size, depth):
+    """Yield (form, thumbnail path or None) in order; misses are made on the pool, if there is one"""
+    pending = deque()
+    for form in forms:
+        target = thumbnail_file(thumbnail_path, form.id, size)
+        if os.path.exists(target):
+            pending.append((form, target))
+        else:
+            source = uploads.source(form)
+            if source is None:
+                pending.append((form, None))
+            elif pool is None:
+                pending.append((form, make_thumbnail(source, target, size)))
+            else:
+                pending.append((form, pool.submit(make_thumbnail, source, target, size)))
+        if len(pending) > depth:
+            yield _resolved(pending.popleft())
+    while pending:
+        yield _resolved(pending.popleft())
+
+
+def _resolved(item):
+    form, thumbnail = item
+    return form, thumbnail if isinstance(thumbnail, str) or thumbnail is None else thumbnail.result()
+
+
+def stream_groups_workbook(groups):
+    """
+    Yield one workbook with a Submissions sheet per group
+
+    Args:
+        groups: Iterable of (group_id, group_name, records), as from iter_user_group_records
+
+    Yields:
+        bytes chunks of the .xlsx file
+    """
+    wb = Workbook(write_only=True)
+    titles = set()
+    for _, group_name, records in groups:
+        write_submissions_sheet(wb.create_sheet(_sheet_title(group_name, titles)), records)
+    yield from stream_workbook(wb)
+
+
+def stream_groups_zip(groups, pool, window=4):
+    """
+    Yield a ZIP archive holding one submissions workbook per group
+
+    Each group's workbook is built on the pool (a process pool builds several
+    at once) while earlier ones are being sent; at most `window` groups are
+    held in memory at a time.
+
+    Args:
+        groups: Iterable of (group_id, group_name, records), as from iter_user_group_records
+        pool: Executor that builds the workbooks
+
+    Yields:
+        bytes chunks of the .zip file
+    """
+    output = _WriteBuffer()
+    pending = deque()
+    names = set()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        def write_next():
+            name, future = pending.popleft()
+            archive.writestr(zipfile.ZipInfo(name, date_time=_zip_timestamp(None)), future.result())
+            return output.drain()
+
+        for _, group_name, records in groups:
+            name = _unique(re.sub(r'[ /\\]', '_', group_name) + '_submissions', names) + '.xlsx'
+            pending.append((name, pool.submit(build_records_workbook, list(records))))
+            if len(pending) >= window:
+                yield write_next()
+        while pending:
+            yield write_next()
+    yield output.drain()
+
+
+def build_records_workbook(records):
+    """Build a single-sheet submissions workbook from FormRecords and return its bytes"""
+    wb = Workbook(write_only=True)
+    write_submissions_sheet(wb.create_sheet("Submissions"), records)
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _sheet_title(name, used):
+    """A valid, unique worksheet title: at most 31 characters and none of []:*?/\\"""
+    title = re.sub(r'[\[\]:*?/\\]', '_', name).strip("'") or 'Group'
+    return _unique(title[:31], used, max_length=31)
+
+
+def _unique(name, used, max_length=None):
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        n += 1
+        suffix = f' ({n})'
+        candidate = (name[:max_length - len(suffix)] if max_length else name) + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def stream_group_changes(forms, tombstones, progress=None):
+    """
+    Yield a workbook of the submissions added and removed since an export cursor
+
+    Added submissions go on the "Submissions" sheet with their id in the
+    last column; removed ones are listed by id on the "Deleted" sheet.
+
+    Args:
+        forms: Iterable of Form objects, as returned by group_changes
+        tombstones: Iterable of FormTombstone objects, as returned by group_changes
+        progress: Optional callable, called with the number of rows written so far
+
+    Yields:
+        bytes chunks of the .xlsx file
+    """
+    wb = Workbook(write_only=True)
+    write_submissions_sheet(wb.create_sheet("Submissions"), forms, progress, include_id=True)
+
+    ws = wb.create_sheet("Deleted")
+    ws.column_dimensions['A'].width = ID_COLUMN_WIDTH
+    ws.column_dimensions['B'].width = 20
+    header_cells = []
+    for header in (ID_HEADER, 'Deleted At'):
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        cell.alignment = HEADER_ALIGNMENT
+        cell.border = THIN_BORDER
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for tombstone in tombstones:
+        ws.append([tombstone.form_id, tombstone.deleted_at.strftime('%Y-%m-%d %H:%M:%S')])
+
+    yield from stream_workbook(wb)
+
+
+def parse_export_cursor(token):
+    """
+    Decode a continuation cursor returned by a previous incremental export
+
+    An empty token starts from the beginning. Raises ValueError if the token
+    is not a cursor.
+    """
+    if not token:
+        return ExportCursor(None, None)
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return ExportCursor(*(
+            (datetime.fromisoformat(key[0]), key[1]) if key else None
+            for key in (data['f'], data['t'])
+        ))
+    except (binascii.Error, KeyError, IndexError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid export cursor') from exc
+
+
+def format_export_cursor(cursor):
+    """Encode a cursor as an opaque URL-safe token"""
+    data = {
+        'f': [cursor.forms[0].isoformat(), cursor.forms[1]] if cursor.forms else None,
+        't': [cursor.tombstones[0].isoformat(), cursor.tombstones[1]] if cursor.tombstones else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def group_changes(group_id, since, columns=None, batch_size=500):
+    """
+    Find the submissions added to and removed from a group after a cursor
+
+    The result is pinned to the newest form and tombstone that exist when it is
+    called, so the returned cursor picks up exactly where this export ends.
+    Both queries are range scans on the (group_id, timestamp) indexes.
+
+    Args:
+        group_id: Group to export
+        since: ExportCursor from parse_export_cursor
+        columns: Form columns to select instead of whole Form objects
+        batch_size: Rows fetched per database round trip
+
+    Returns:
+        Tuple of (forms, tombstones, next ExportCursor). Only the cursor is
+        read here; as with iter_group_forms, the forms and tombstones queries
+        run once they are iterated.
+    """
+    latest = ExportCursor(
+        db.session.execute(
+            sa.select(Form.submitted_at, Form.id).where(Form.group_id == group_id)
+            .order_by(Form.submitted_at.desc(), Form.id.desc()).limit(1)
+        ).first(),
+        db.session.execute(
+            sa.select(FormTombstone.deleted_at, FormTombstone.id).where(FormTombstone.group_id == group_id)
+            .order_by(FormTombstone.deleted_at.desc(), FormTombstone.id.desc()).limit(1)
+        ).first(),
+    )
+    until = ExportCursor(
+        tuple(latest.forms) if latest.forms else since.forms,
+        tuple(latest.tombstones) if latest.tombstones else since.tombstones,
+    )
+
+    forms_query = (
+        sa.select(*columns) if columns else sa.select(Form)
+    ).where(Form.group_id == group_id).where(
+        _key_range(Form.submitted_at, Form.id, since.forms, until.forms)
+    ).order_by(Form.submitted_at, Form.id).execution_options(yield_per=batch_size)
+
+    tombstones_query = sa.select(FormTombstone).where(FormTombstone.group_id == group_id).where(
+        _key_range(FormTombstone.deleted_at, FormTombstone.id, since.tombstones, until.tombstones)
+    ).order_by(FormTombstone.deleted_at, FormTombstone.id).execution_options(yield_per=batch_size)
+    return _iter_query(forms_query, scalars=not columns), _iter_query(tombstones_query), until
+
+
+def _iter_query(query, scalars=True):
+    """Yield the objects (or with scalars=False, the rows) of a select, executing it on first iteration"""
+    yield from db.session.scalars(query) if scalars else db.session.execute(query)
+
+
+def _key_range(moment, ident, after, until):
+    """(moment, ident) > after and <= until; after None means unbounded below"""
+    if until is None:
+        return sa.false()
+    condition = sa.or_(moment < until[0], sa.and_(moment == until[0], ident <= until[1]))
+    if after is not None:
+        condition = sa.and_(
+            condition, sa.or_(moment > after[0], sa.and_(moment == after[0], ident > after[1]))
+        )
+    return condition
+
+
+def stream_workbook(wb):
+    """
+    Save a workbook on a background thread and yield the bytes as they are written
+
+    The consumer may stop early (for example when the client disconnects);
+    closing the generator cancels the save.
+    """
+    pipe = _ChunkPipe()
+
+    def save():
+        try:
+            wb.save(pipe)
+        except BaseException as exc:
+            pipe.finish(exc)
+        else:
+            pipe.finish()
+
+    thread = threading.Thread(target=save, daemon=True)
+    thread.start()
+    try:
+        yield from pipe
+    finally:
+        pipe.cancel()
+        thread.join()
+
+
+class _ChunkPipe:
+    """Write-only file object that hands fixed-size chunks to a reading thread"""
+    _EOF = object()
+
+    def __init__(self, chunk_size=64 * 1024, depth=8):
+        self._chunks = queue.Queue(maxsize=depth)
+        self._buffer = bytearray()
+        self._chunk_size = chunk_size
+        self._cancelled = threading.Event()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self, error=None):
+        try:
+            if error is None and self._buffer:
+                self._put(bytes(self._buffer))
+            self._put(error if error is not None else self._EOF)
+        except OSError:
+            pass  # Consumer is gone, nobody to tell
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise OSError('Export stream was closed before it finished')
+
+    def __iter__(self):
+        while True:
+            item = self._chunks.get()
+            if item is self._EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def photo_archive_name(form, extension):
+    """Name of a form's photo inside the ZIP export: FirstName_LastName_shortid.ext"""
+    return f"{form.first_name}_{form.last_name}_{form.id[:8]}.{extension}"
+
+
+def create_photo_export(forms, uploads):
+    """
+    Create a ZIP archive of the forms' photos in memory
+
+    Args:
+        forms: List of objects with the PHOTO_COLUMNS attributes
+        uploads: UploadStore holding the photos
+
+    Returns:
+        Tuple of (BytesIO with the ZIP file, number of photos added)
+    """
+    zip_buffer = BytesIO()
+    files_added = 0
+
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for form in forms:
+            photo = uploads.open(form)
+
+            if photo is not None:
+                # Extension detected at upload, default to PNG for older submissions
+                filename = photo_archive_name(form, form.image_extension or 'png')
+
+                # Add file to ZIP
+                with photo as f:
+                    zip_file.writestr(filename, f.read())
+                    files_added += 1
+
+    zip_buffer.seek(0)
+    return zip_buffer, files_added
+
+
+def photo_export_rows(group_id):
+    """The group's forms, newest first, with only the columns the photo export needs"""
+    query = (
+        sa.select(*PHOTO_COLUMNS)
+        .where(Form.group_id == group_id)
+        .order_by(Form.submitted_at.desc())
+    )
+    return db.session.execute(query).all()
+
+
+def stream_group_photos(forms, uploads, readahead=4, chunk_size=256 * 1024, progress=None,
+                        deleted=None):
+    """
+    Yield a ZIP archive of the forms' photos as it is written
+
+    Each entry's local header and data are yielded as soon as they are
+    produced, so only the photos being read ahead are ever held in memory.
+    The next `readahead` files are read on a thread pool while the current
+    one is sent. Already-compressed formats are STORED rather than deflated.
+    Forms whose photo is missing are skipped.
+
+    Args:
+        forms: Iterable of objects with the PHOTO_COLUMNS attributes
+        uploads: UploadStore holding the photos
+        readahead: Number of files read ahead of the one being sent
+        progress: Optional callable, called with the number of photos written so far
+        deleted: Optional iterable of removed submission ids, listed in deleted.txt
+            at the end of the archive (used by incremental exports)
+
+    Yields:
+        bytes chunks of the .zip file
+    """
+    output = _WriteBuffer()
+    photos_done = 0
+    with ThreadPoolExecutor(max_workers=readahead) as pool, \
+            zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for form, chunks in _read_ahead(pool, forms, uploads, readahead, chunk_size):
+            if chunks is None:
+                continue
+
+            extension = form.image_extension or 'png'
+            info = zipfile.ZipInfo(photo_archive_name(form, extension),
+                                   date_time=_zip_timestamp(form.submitted_at))
+            info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS \
+                else zipfile.ZIP_DEFLATED
+            info.file_size = sum(len(chunk) for chunk in chunks)
+
+            with archive.open(info, 'w') as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield output.drain()
+            yield output.drain()
+
+            photos_done += 1
+            if progress:
+                progress(photos_done)
+
+        if deleted is not None:
+            listing = ''.join(f'{form_id}\n' for form_id in deleted)
+            archive.writestr(zipfile.ZipInfo('deleted.txt', date_time=_zip_timestamp(None)), listing)
+    yield output.drain()
+
+
+def _read_ahead(pool, forms, uploads, depth, chunk_size):
+    """Yield (form, chunks) in order while the next `depth` files load on the pool"""
+    pending = deque()
+    backend = uploads.backend
+    forms = iter(forms)
+    for form in forms:
+        pending.append((form, pool.submit(_read_photo, backend, uploads.keys(form), chunk_size)))
+        if len(pending) > depth:
+            head, future = pending.popleft()
+            yield head, future.result()
+    while pending:
+        head, future = pending.popleft()
+        yield head, future.result()
+
+
+def _read_photo(backend, keys, chunk_size):
+    """Read the first of keys that exists as a list of chunks, or None if none does"""
+    photo = read_first(backend, keys)
+    if photo is None:
+        return None
+    with photo as f:
+        return list(iter(lambda: f.read(chunk_size), b''))
+
+
+def _zip_timestamp(moment):
+    """ZIP entries cannot be dated before 1980"""
+    if moment is None or moment.year < 1980:
+        moment = datetime.now()
+    return moment.timetuple()[:6]
+
+
+class _WriteBuffer:
+    """Unseekable file object whose contents are taken with drain()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def streaming_download(chunks, mimetype, download_name):
+    """
+    Wrap a generator of bytes in an attachment response
+
+    The generator runs inside the request context, so it may keep querying
+    the database while the response is being sent.
+    """
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    return response
+
+
+def content_disposition(download_name, as_attachment=True):
+    """A Content-Disposition value naming the file the way send_file does"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name)
+        simple = simple.encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        names = {'filename': simple, 'filename*': f"UTF-8''{quoted}"}
+    else:
+        names = {'filename': download_name}
+
+    headers = Headers()
+    headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', **names)
+    return headers['Content-Disposition']
+
+
 def get_image_filename(form):
     """
     Generate a standardized filename for a form's image
     Format: FirstName_LastName_id
-    
+
     Args:
         form: Form object
-    
+
     Returns:
         String filename without extension
     """
@@ -0,0 +1,144 @@
+"""Durable queue of image work on stored photos, run off the request by image_worker.py"""
+from datetime import datetime, timezone
+import time
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.background import utc
+from app.models import Form, ImageJob
+from app.uploads import uploads
+from app.export_cache import invalidate_group_exports
+
+
+def enqueue_image_job(kind, image_hash, delay=None):
+    """Add a job to the session, to run after delay if given; it is queued when the caller commits"""
+    job = ImageJob(kind=kind, image_hash=image_hash)
+    if delay is not None:
+        job.run_after = datetime.now(timezone.utc) + delay
+    db.session.add(job)
+    return job
+
+
+def claim_image_job(worker):
+    """
+    Mark the oldest runnable job as running and return it, or None if there is none
+
+    The claim is a conditional UPDATE, so any number of worker threads and
+    processes can share the queue without taking the same job.
+    """
+    while True:
+        now = datetime.now(timezone.utc)
+        job_id = db.session.scalar(
+            sa.select(ImageJob.id)
+            .where(ImageJob.status == 'queued', ImageJob.run_after <= now)
+            .order_by(ImageJob.run_after, ImageJob.id)
+            .limit(1)
+        )
+        if job_id is None:
+            db.session.commit()
+            return None
+
+        claimed = db.session.execute(
+            sa.update(ImageJob)
+            .where(ImageJob.id == job_id, ImageJob.status == 'queued')
+            .values(status='running', worker=worker, started_at=now, attempts=ImageJob.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            job = db.session.get(ImageJob, job_id)
+            job.wait_seconds = (now - utc(job.run_after)).total_seconds()
+            db.session.commit()
+            return job
+        # Another worker took it first; look again
+
+
+def run_image_job(job, pool):
+    """
+    Run a claimed job on pool, then record its outcome and timing
+
+    A failed job is queued again after IMAGE_JOB_RETRY_DELAY, doubled for
+    each earlier attempt, until it has been tried IMAGE_JOB_MAX_ATTEMPTS times.
+    """
+    start = time.perf_counter()
+    try:
+        IMAGE_JOB_KINDS[job.kind](job.image_hash, pool)
+    except Exception as exc:
+        current_app.logger.exception('Image job %s (%s) failed', job.id, job.kind)
+        db.session.rollback()
+        job.error = f'{type(exc).__name__}: {exc}'
+        if job.attempts < current_app.config['IMAGE_JOB_MAX_ATTEMPTS']:
+            job.status = 'queued'
+            job.run_after = datetime.now(timezone.utc) + \
+                current_app.config['IMAGE_JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1)
+        else:
+            job.status = 'failed'
+    else:
+        job.status = 'done'
+        job.error = None
+    job.run_seconds = time.perf_counter() - start
+    job.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+    return job
+
+
+def requeue_stalled_jobs():
+    """Retry running jobs older than IMAGE_JOB_TIMEOUT, whose worker presumably died; returns how many"""
+    now = datetime.now(timezone.utc)
+    stalled = (ImageJob.status == 'running') & (ImageJob.started_at < now - current_app.config['IMAGE_JOB_TIMEOUT'])
+    out_of_attempts = ImageJob.attempts >= current_app.config['IMAGE_JOB_MAX_ATTEMPTS']
+    failed = db.session.execute(
+        sa.update(ImageJob).where(stalled, out_of_attempts)
+        .values(status='failed', error='Timed out', finished_at=now)
+    ).rowcount
+    requeued = db.session.execute(
+        sa.update(ImageJob).where(stalled, ~out_of_attempts)
+        .values(status='queued', error='Timed out', run_after=now)
+    ).rowcount
+    db.session.commit()
+    return failed + requeued
+
+
+def prune_image_jobs():
+    """Delete finished jobs older than IMAGE_JOB_TTL; returns how many"""
+    cutoff = datetime.now(timezone.utc) - current_app.config['IMAGE_JOB_TTL']
+    deleted = db.session.execute(
+        sa.delete(ImageJob).where(ImageJob.status == 'done', ImageJob.finished_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _make_derivatives(image_hash, pool):
+    source = uploads.source_for_hash(image_hash)
+    if source is None:
+        raise FileNotFoundError(f'Photo {image_hash} is not stored')
+    uploads.create_derivatives(image_hash, source, pool)
+
+
+def _normalize(image_hash, pool):
+    normalized_hash = uploads.normalize_stored(image_hash, pool)
+    if normalized_hash is None:
+        enqueue_image_job('derivatives', image_hash)
+        return
+    enqueue_image_job('derivatives', normalized_hash)
+    # Cached exports of the groups using the photo hold the old one. The commit
+    # changes their group_version as well, so no export started earlier is reused
+    for group_id in db.session.scalars(
+        sa.select(Form.group_id).where(Form.image_hash == normalized_hash, Form.group_id.is_not(None)).distinct()
+    ):
+        invalidate_group_exports(group_id)
+    # An identical submission may be saving the original right now, so it is
+    # released only once UPLOAD_GRACE_PERIOD has passed
+    enqueue_image_job('release', image_hash, delay=current_app.config['UPLOAD_GRACE_PERIOD'])
+
+
+def _release(image_hash, pool):
+    uploads.release_many([(None, image_hash, None)])
+
+
+# Job kind to handler, called with the photo's hash and the process pool
+IMAGE_JOB_KINDS = {
+    'derivatives': _make_derivatives,
+    'normalize': _normalize,  # Queues 'derivatives' and 'release' for the photo it leaves behind
+    'release': _release,
+}
@@ -0,0 +1,119 @@
+"""Image processing helpers that run in worker processes"""
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import multiprocessing
+import os
+import threading
+from PIL import Image, ImageOps
+
+ORIENTATION_TAG = 0x0112  # EXIF Orientation
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def process_pool(max_workers=None):
+    """
+    A process pool for CPU-bound work (Pillow, building workbooks), shared by the whole process
+
+    Workers are spawned rather than forked, since the web process runs other
+    threads (export jobs, read-ahead pools) whose locks a fork could copy.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def thumbnail_file(thumbnail_path, form_id, size):
+    """Where the size x size spreadsheet thumbnail of a form's photo is cached"""
+    return os.path.join(thumbnail_path, f'{form_id}_{size}.jpg')
+
+
+def make_thumbnail(source, target, size, quality=80):
+    """
+    Write a JPEG copy of source (a path or the image bytes) scaled down to fit in size x size pixels
+
+    EXIF orientation is applied so the thumbnail is upright. The file is
+    written under a temporary name and renamed, so a reader never sees a
+    partial thumbnail.
+
+    Returns:
+        target, or None if source is missing or is not an image Pillow can read
+    """
+    partial = f'{target}.{os.getpid()}.part'
+    try:
+        with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(partial, format='JPEG', quality=quality)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+    os.replace(partial, target)
+    return target
+
+
+def make_derivatives(source, sizes, quality=80):
+    """
+    Encode WebP copies of source (a path or the image bytes) scaled down to fit each size
+
+    Returns:
+        Dict of size to WebP bytes; empty if source is not an image Pillow can read
+    """
+    derivatives = {}
+    try:
+        with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            for size in sorted(sizes, reverse=True):
+                # Scale down from the previous (larger) copy, which is cheaper than from the original
+                img.thumbnail((size, size))
+                output = BytesIO()
+                img.save(output, format='WEBP', quality=quality, method=4)
+                derivatives[size] = output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return {}
+    return derivatives
+
+
+def normalize_image(source, target, max_dimension, quality=85):
+    """
+    Write a JPEG copy of source (a path or the image bytes) that fits in max_dimension x max_dimension pixels
+
+    EXIF orientation is applied, and the rest of the metadata (location
+    included) is dropped. Photos that could not gain anything are left alone:
+    JPEGs already upright and small enough, images with transparency or
+    animation, and copies that turn out no smaller than the original.
+
+    Returns:
+        target, or None if source was left alone or is not an image Pillow can read
+    """
+    try:
+        with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as img:
+            if getattr(img, 'is_animated', False) or 'A' in img.getbands() or 'transparency' in img.info:
+                return None
+            rotated = img.getexif().get(ORIENTATION_TAG, 1) != 1
+            oversized = max(img.size) > max_dimension
+            if img.format == 'JPEG' and not rotated and not oversized:
+                return None
+            # Let the JPEG decoder skip straight to a nearby smaller scale
+            img.draft('RGB', (max_dimension, max_dimension))
+            icc_profile = img.info.get('icc_profile')
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(target, format='JPEG', quality=quality, optimize=True, icc_profile=icc_profile)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    source_size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    if not rotated and not oversized and os.path.getsize(target) >= source_size:
+        return None
+    return target
@@ -0,0 +1,73 @@
+"""Throttled last_seen tracking, written in bulk by a background thread instead of on each request"""
+from datetime import datetime, timezone
+import threading
+import time
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.background import LazyExecutor, utc
+from app.models import User
+
+_pending = {}  # User id to the visit time not yet written
+_recorded = {}  # User id to the last visit time queued for writing, pruned by each flush
+_flush_scheduled = False
+_lock = threading.Lock()
+
+_executor = LazyExecutor('last-seen')
+
+
+def mark_seen(user):
+    """
+    Note that a user was just seen, without touching the database
+
+    The visit is queued only when the user's last_seen is at least
+    LAST_SEEN_INTERVAL old, and queued visits are written together
+    LAST_SEEN_FLUSH_DELAY seconds later.
+    """
+    global _flush_scheduled
+    now = datetime.now(timezone.utc)
+    interval = current_app.config['LAST_SEEN_INTERVAL']
+    with _lock:
+        last = _recorded.get(user.id) or utc(user.last_seen)
+        if last is not None and now - last < interval:
+            return
+        _recorded[user.id] = now
+        _pending[user.id] = now
+        if _flush_scheduled:
+            return
+        _flush_scheduled = True
+    _executor.submit(_flush_later, current_app._get_current_object())
+
+
+def flush_last_seen():
+    """Write every queued visit with one bulk UPDATE; returns how many users were updated"""
+    global _flush_scheduled
+    cutoff = datetime.now(timezone.utc) - current_app.config['LAST_SEEN_INTERVAL']
+    with _lock:
+        visits = dict(_pending)
+        _pending.clear()
+        _flush_scheduled = False
+        # Visits older than the interval no longer hold back a write, so the
+        # map only keeps users seen lately instead of every user since startup
+        for user_id in [user_id for user_id, seen in _recorded.items() if seen < cutoff]:
+            del _recorded[user_id]
+    if not visits:
+        return 0
+    try:
+        db.session.execute(sa.update(User), [{'id': user_id, 'last_seen': seen} for user_id, seen in visits.items()])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Recording last_seen for %d users failed', len(visits))
+        return 0
+    return len(visits)
+
+
+def _flush_later(app):
+    time.sleep(app.config['LAST_SEEN_FLUSH_DELAY'])
+    with app.app_context():
+        try:
+            flush_last_seen()
+        finally:
+            db.session.remove()
+
@@ -3,7 +3,7 @@ from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, IntegerField, SubmitField, DateField, DecimalField, SelectField, BooleanField, TextAreaField
 from wtforms.validators import ValidationError, DataRequired, InputRequired, NumberRange, Length, Optional
 from flask import current_app
-import filetype
+from app.uploads import uploads
 
 class GroupForm(FlaskForm):
     name = StringField("Group Name", validators=[DataRequired(), Length(min=1, max=120)])
@@ -137,8 +137,17 @@ class IDForm(FlaskForm):
 
 
     def validate_image(self, image):
-        data = image.data.read()
-        kind = filetype.guess(data)
-        image.data.seek(0)  # Reset file pointer after reading
-        if kind is None or kind.extension not in current_app.config['UPLOAD_EXTENSIONS']:
-            raise ValidationError("Invalid image format.")
\ No newline at end of file
+        # Checked, hashed and written to the upload store's staging area in one pass
+        try:
+            self.image_upload = uploads.stage(image.data.stream, current_app.config['UPLOAD_EXTENSIONS'],
+                                              current_app.config['UPLOAD_MAX_SIZE'])
+        except ValueError as exc:
+            raise ValidationError(str(exc))
+
+    def validate(self, extra_validators=None):
+        self.image_upload = None
+        valid = super().validate(extra_validators)
+        if not valid and self.image_upload is not None:
+            # Another field failed, so the photo will be sent again
+            self.image_upload.discard()
+        return valid
\ No newline at end of file
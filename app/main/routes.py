@@ -1,5 +1,4 @@
-from flask import render_template, flash, redirect, url_for, request, abort, current_app, send_file
-from flask import send_from_directory
+from flask import render_template, flash, redirect, url_for, request, abort, current_app, send_file, jsonify
 from app import db
 from app.main.forms import InviteForm, IDForm, GroupForm
 from flask_login import current_user, login_required
@@ -7,16 +6,28 @@ import sqlalchemy as sa
 from app.models import Link, Form, Group
 from datetime import datetime, timezone, timedelta
 import os
-import filetype
 import secrets
+from werkzeug.http import is_resource_modified
 from app.main import bp
-from app.export_utils import create_group_export, get_image_filename
+from app.export_utils import create_group_export, get_image_filename, stream_group_export, \
+    iter_group_forms, streaming_download, XLSX_MIMETYPE, create_photo_export, stream_group_photos, \
+    photo_export_rows, stream_group_changes, group_changes, parse_export_cursor, format_export_cursor, \
+    iter_group_records, RECORD_WRITERS, EXPORT_KINDS, stream_group_export_with_photos, \
+    iter_user_group_records, stream_groups_workbook, stream_groups_zip, PHOTO_COLUMNS, content_disposition
+from app.export_jobs import submit_export_job, get_export_job, export_job_artifact
+from app.export_cache import group_version, cached_export, cache_export_stream, invalidate_group_exports
+from app.images import process_pool
+from app.uploads import uploads
+from app.image_jobs import enqueue_image_job
+from app.deletions import delete_forms
+from app.pagination import keyset_paginate
+from app.last_seen import mark_seen
+from app.capacity import reserve_group_slot
 
 @bp.before_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.now(timezone.utc)
-        db.session.commit()
+        mark_seen(current_user)
 
 @bp.route('/', methods=['GET', 'POST'])
 @bp.route('/index', methods=['GET', 'POST'])
@@ -37,36 +48,27 @@ def index():
         flash('Link generated successfully!')
         return redirect(url_for('main.index'))
 
-    page = request.args.get('page', 1, type=int)
-    query = current_user.links.select().order_by(Link.created_at.desc())
-    links = db.paginate(query, page=page, per_page=current_app.config['LINK_PER_PAGE'], error_out=False)
-    next_url = url_for('main.index', page=links.next_num) \
+    links = keyset_paginate(current_user.links.select(), (Link.created_at, Link.id),
+                            request.args.get('page'), current_app.config['LINK_PER_PAGE'])
+    next_url = url_for('main.index', page=links.next_cursor) \
         if links.has_next else None
-    prev_url = url_for('main.index', page=links.prev_num) \
+    prev_url = url_for('main.index', page=links.prev_cursor) \
         if links.has_prev else None
 
-    def get_form(link_id):
-        # Get the first form for this link (for legacy links)
-        query = sa.select(Form).where(Form.link_id == link_id).limit(1)
-        form_result = db.session.scalars(query).first()
-        return form_result
-
-    # Get groups for the dashboard
-    groups_query = sa.select(Group).where(Group.user_id == current_user.id).order_by(Group.created_at.desc())
-    groups = db.session.scalars(groups_query).all()
+    # The submission of each filled link on this page, in one query
+    first_forms = _first_forms([link.id for link in links.items if link.used])
 
-    return render_template('index.html', title='Home', links=links.items, form=form, next_url=next_url, prev_url=prev_url, get_form=get_form, groups=groups)
+    return render_template('index.html', title='Home', links=links.items, form=form, next_url=next_url, prev_url=prev_url, first_forms=first_forms)
 
 
 @bp.route('/user')
 @login_required
 def user():
-    page = request.args.get('page', 1, type=int)
-    query = current_user.links.select().order_by(Link.created_at.desc())
-    links = db.paginate(query, page=page, per_page=current_app.config['LINK_PER_PAGE'], error_out=False)
-    next_url = url_for('main.user', page=links.next_num) \
+    links = keyset_paginate(current_user.links.select(), (Link.created_at, Link.id),
+                            request.args.get('page'), current_app.config['LINK_PER_PAGE'])
+    next_url = url_for('main.user', page=links.next_cursor) \
         if links.has_next else None
-    prev_url = url_for('main.user', page=links.prev_num) \
+    prev_url = url_for('main.user', page=links.prev_cursor) \
         if links.has_prev else None
     return render_template('user.html', title="User", links=links.items, next_url=next_url, prev_url=prev_url)
     
@@ -81,6 +83,8 @@ def form(link_id):
 
     form = IDForm(allowed=current_app.config['UPLOAD_EXTENSIONS'])
     if form.validate_on_submit():
+        upload = form.image_upload
+
         # Generate unique ID for this form submission
         form_id = secrets.token_urlsafe(16)
 
@@ -102,24 +106,36 @@ def form(link_id):
             zip_code=form.zip_code.data,
             organ_donor=form.organ_donor.data,
             restrictions_corrective_lenses=form.restrictions_corrective_lenses.data,
-            group_id=link.group_id
+            group_id=link.group_id,
+            image_mime=upload.mime,
+            image_extension=upload.extension,
+            image_size=upload.size,
+            image_hash=upload.image_hash
         )
         if form.middle_name.data:
             f.middle_name = form.middle_name.data
 
-        # Save image with form ID instead of link ID
-        form.image.data.save(os.path.join(current_app.config['UPLOAD_PATH'], form_id))
+        # Photos are stored once per content hash, shared by identical uploads
+        uploads.save(upload)
+        # Smaller WebP copies for review pages are made by image_worker.py, after
+        # it has downscaled, straightened and re-encoded the photo if IMAGE_NORMALIZE is on
+        enqueue_image_job('normalize' if current_app.config['IMAGE_NORMALIZE'] else 'derivatives', f.image_hash)
 
         # Mark link as used if it's a non-group link (dashboard link)
-        if not link.group:
+        if not link.group_id:
             link.used = True
 
-        # Increment group count if this link belongs to a group
-        if link.group:
-            link.group.current_count += 1
+        # Take a place in the group last, so the row is locked only until the commit below
+        if link.group_id and not reserve_group_slot(link.group_id):
+            # The photo just stored is unreferenced and is swept up by gc_uploads.py
+            db.session.rollback()
+            flash('This group has reached its capacity limit!', 'error')
+            return render_template('form.html', title='IDForm', form=form)
 
         db.session.add(f)
         db.session.commit()
+        if f.group_id:
+            invalidate_group_exports(f.group_id)
         return redirect(url_for('main.success'))
     return render_template('form.html', title='IDForm', form=form)
 
@@ -138,27 +154,154 @@ def view_form(form_id):
 @bp.route('/uploads/<filename>')
 @login_required
 def upload(filename):
-    filepath = os.path.join(current_app.config['UPLOAD_PATH'], filename)
-    kind = filetype.guess(filepath)
-    mimetype = kind.mime if kind else 'application/octet-stream'
-    return send_from_directory(current_app.config['UPLOAD_PATH'], filename, as_attachment=False, mimetype=mimetype)
+    form = db.first_or_404(sa.select(Form).where(Form.id == filename))
+    not_modified = _not_modified(form.image_hash, _photo_changed_at(form), current_app.config['UPLOAD_MAX_AGE'])
+    if not_modified:
+        return not_modified
+    mimetype = form.image_mime or 'application/octet-stream'
+    url = uploads.url(form, mimetype)
+    if url:
+        return redirect(url)
+    return _send_photo(_uploaded_photo(form), mimetype, form.image_hash, _photo_changed_at(form),
+                       current_app.config['UPLOAD_MAX_AGE'])
 
 @bp.route('/download/<filename>')
 @login_required
 def download(filename):
-    filepath = os.path.join(current_app.config['UPLOAD_PATH'], filename)
-    kind = filetype.guess(filepath)
-    extension = kind.extension if kind else 'jpg'
-
-    # Try to get the form to generate a better filename
-    form = db.session.get(Form, filename)
-    if form:
-        # Use FirstName_LastName_id format
-        download_name = f"{form.first_name}_{form.last_name}_{form.id}.{extension}"
+    form = db.first_or_404(sa.select(Form).where(Form.id == filename))
+    not_modified = _not_modified(form.image_hash, _photo_changed_at(form), current_app.config['UPLOAD_MAX_AGE'])
+    if not_modified:
+        return not_modified
+    extension = form.image_extension or 'jpg'
+    # Use FirstName_LastName_id format
+    download_name = f"{form.first_name}_{form.last_name}_{form.id}.{extension}"
+    url = uploads.url(form, form.image_mime, content_disposition(download_name))
+    if url:
+        return redirect(url)
+    return _send_photo(_uploaded_photo(form), form.image_mime or 'application/octet-stream', form.image_hash,
+                       _photo_changed_at(form), current_app.config['UPLOAD_MAX_AGE'], download_name=download_name)
+
+@bp.route('/uploads/<filename>/<int:size>')
+@login_required
+def upload_derivative(filename, size):
+    """A scaled-down WebP copy of a photo, cached by the browser for IMAGE_DERIVATIVE_MAX_AGE"""
+    if size not in current_app.config['IMAGE_DERIVATIVE_SIZES']:
+        abort(404)
+    form = db.first_or_404(sa.select(Form).where(Form.id == filename))
+    if not form.image_hash:
+        return redirect(url_for('main.upload', filename=form.id))
+
+    etag = f'{form.image_hash}-{size}'
+    max_age = current_app.config['IMAGE_DERIVATIVE_MAX_AGE']
+    not_modified = _not_modified(etag, _photo_changed_at(form), max_age)
+    if not_modified:
+        return not_modified
+    url = uploads.derivative_url(form.image_hash, size)
+    if url:
+        return redirect(url)
+    path = uploads.derivative_path(form.image_hash, size)
+    if path is None:
+        # Not made yet (image_worker.py, backfill_derivatives.py) or never will be
+        # (an undecodable photo); fall back to the original, on any backend
+        return redirect(url_for('main.upload', filename=form.id))
+
+    return _send_photo(path, 'image/webp', etag, _photo_changed_at(form), max_age)
+
+def _first_forms(link_ids):
+    """Map each of link_ids to its earliest submission, for links that have one"""
+    if not link_ids:
+        return {}
+    first = (
+        sa.select(Form.link_id, sa.func.min(Form.submitted_at).label('submitted_at'))
+        .where(Form.link_id.in_(link_ids))
+        .group_by(Form.link_id)
+        .subquery()
+    )
+    forms = db.session.scalars(
+        sa.select(Form).join(first, (Form.link_id == first.c.link_id) & (Form.submitted_at == first.c.submitted_at))
+    )
+    first_forms = {}
+    for form in forms:
+        first_forms.setdefault(form.link_id, form)
+    return first_forms
+
+def _submission_counts(group_ids):
+    """Map each of group_ids to its number of submissions, counted in one GROUP BY"""
+    if not group_ids:
+        return {}
+    return dict(db.session.execute(
+        sa.select(Form.group_id, sa.func.count(Form.id))
+        .where(Form.group_id.in_(group_ids))
+        .group_by(Form.group_id)
+    ).all())
+
+def _photo_changed_at(form):
+    """When the form's photo was stored: its submission, or the normalization that replaced it"""
+    return form.image_updated_at or form.submitted_at
+
+def _uploaded_photo(form):
+    """Local path of the form's stored photo, or a 404"""
+    path = uploads.path(form)
+    if path is None:
+        abort(404)
+    return path
+
+def _send_photo(path, mimetype, etag, last_modified, max_age, download_name=None):
+    """
+    Send a locally stored photo, or with UPLOAD_OFFLOAD set, only its headers
+    and a pointer that lets the front proxy send the file itself
+    """
+    offload = current_app.config['UPLOAD_OFFLOAD']
+    if not offload:
+        response = send_file(path, mimetype=mimetype, as_attachment=download_name is not None,
+                             download_name=download_name, conditional=True, etag=etag or True,
+                             last_modified=last_modified)
+        return _cache_photo(response, etag, max_age)
+
+    response = current_app.response_class(mimetype=mimetype)
+    if offload == 'x-sendfile':
+        response.headers['X-Sendfile'] = path
+    elif offload == 'x-accel-redirect':
+        relative = os.path.relpath(path, current_app.config['UPLOAD_PATH']).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_OFFLOAD_PREFIX'].rstrip('/') + '/' + relative
     else:
-        download_name = f'{filename}.{extension}'
-
-    return send_from_directory(current_app.config['UPLOAD_PATH'], filename, as_attachment=True, download_name=download_name)
+        raise ValueError(f"Unknown UPLOAD_OFFLOAD {offload!r}; expected 'x-accel-redirect' or 'x-sendfile'")
+    if download_name is not None:
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+    if etag:
+        response.set_etag(etag)
+    response.last_modified = last_modified
+    return _cache_photo(response, etag, max_age)
+
+def _not_modified(etag, last_modified, max_age):
+    """
+    A 304 response if the browser's copy is current, else None
+
+    The ETag is the photo's hash and Last-Modified its _photo_changed_at, so
+    this is decided from the form row alone, before the photo is looked up in
+    storage.
+    """
+    if not etag or is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return _cache_photo(response, etag, max_age)
+
+def _cache_photo(response, etag, max_age):
+    """
+    Let the browser keep a photo response for max_age, then revalidate it
+
+    Not immutable: normalization (image_worker.py, normalize_uploads.py) can
+    replace the photo behind a URL after it was first sent.
+    """
+    if not etag:
+        # Photos stored before their hash was recorded keep send_file's default revalidation
+        return response
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = int(max_age.total_seconds())
+    return response
 
 @bp.route('/groups', methods=['GET', 'POST'])
 @login_required
@@ -179,16 +322,37 @@ def groups():
         flash(f'Group "{group.name}" created successfully!')
         return redirect(url_for('main.groups'))
 
-    page = request.args.get('page', 1, type=int)
-    query = current_user.groups.select().order_by(Group.created_at.desc())
-    groups_paginated = db.paginate(query, page=page, per_page=current_app.config['LINK_PER_PAGE'], error_out=False)
-    next_url = url_for('main.groups', page=groups_paginated.next_num) \
+    groups_paginated = keyset_paginate(current_user.groups.select(), (Group.created_at, Group.id),
+                                       request.args.get('page'), current_app.config['LINK_PER_PAGE'])
+    next_url = url_for('main.groups', page=groups_paginated.next_cursor) \
         if groups_paginated.has_next else None
-    prev_url = url_for('main.groups', page=groups_paginated.prev_num) \
+    prev_url = url_for('main.groups', page=groups_paginated.prev_cursor) \
         if groups_paginated.has_prev else None
 
+    submission_counts = _submission_counts([group.id for group in groups_paginated.items])
+
     return render_template('groups.html', title='Groups', form=form, groups=groups_paginated.items,
-                         next_url=next_url, prev_url=prev_url)
+                         submission_counts=submission_counts, next_url=next_url, prev_url=prev_url)
+
+@bp.route('/groups/export')
+@login_required
+def export_all_groups():
+    """Export every group's submissions in one workbook, or ?format=zip for a workbook per group"""
+    kind = request.args.get('format', 'xlsx')
+    if kind not in ('xlsx', 'zip'):
+        abort(400)
+
+    has_forms = db.session.scalar(sa.select(sa.exists().where(Form.group_id == Group.id)
+                                            .where(Group.user_id == current_user.id)))
+    if not has_forms:
+        flash('No submissions to export in any of your groups.', 'warning')
+        return redirect(url_for('main.groups'))
+
+    groups = iter_user_group_records(current_user.id, current_app.config['EXPORT_BATCH_SIZE'])
+    if kind == 'zip':
+        chunks = stream_groups_zip(groups, process_pool(current_app.config['IMAGE_WORKERS']))
+        return streaming_download(chunks, 'application/zip', 'all_groups_submissions.zip')
+    return streaming_download(stream_groups_workbook(groups), XLSX_MIMETYPE, 'all_groups_submissions.xlsx')
 
 @bp.route('/group/<int:group_id>', methods=['GET', 'POST'])
 @login_required
@@ -227,51 +391,104 @@ def view_group(group_id):
         return redirect(url_for('main.view_group', group_id=group_id))
 
     # Get links for this group
-    page = request.args.get('page', 1, type=int)
-    query = group.links.select().order_by(Link.created_at.desc())
-    links = db.paginate(query, page=page, per_page=current_app.config['LINK_PER_PAGE'], error_out=False)
-    next_url = url_for('main.view_group', group_id=group_id, page=links.next_num) \
-        if links.has_next else None
-    prev_url = url_for('main.view_group', group_id=group_id, page=links.prev_num) \
-        if links.has_prev else None
-
-    def get_form(link_id):
-        # Get the first form for this link
-        query = sa.select(Form).where(Form.link_id == link_id).limit(1)
-        return db.session.scalars(query).first()
-
-    # Get all forms for this group for the submissions section
-    forms_query = sa.select(Form).where(Form.group_id == group_id).order_by(Form.submitted_at.desc())
-    all_forms = db.session.scalars(forms_query).all()
+    page = request.args.get('page')
+    submissions_page = request.args.get('submissions_page')
+    links = keyset_paginate(group.links.select(), (Link.created_at, Link.id),
+                            page, current_app.config['LINK_PER_PAGE'])
+    next_url = url_for('main.view_group', group_id=group_id, page=links.next_cursor,
+                       submissions_page=submissions_page) if links.has_next else None
+    prev_url = url_for('main.view_group', group_id=group_id, page=links.prev_cursor,
+                       submissions_page=submissions_page) if links.has_prev else None
+
+    # One page of the group's submissions, as plain rows of the columns the table shows
+    submissions = keyset_paginate(
+        sa.select(Form.id, Form.first_name, Form.last_name, Form.submitted_at).where(Form.group_id == group_id),
+        (Form.submitted_at, Form.id), submissions_page, current_app.config['SUBMISSIONS_PER_PAGE']
+    )
+    submissions_next_url = url_for('main.view_group', group_id=group_id, page=page,
+                                   submissions_page=submissions.next_cursor, _anchor='submissions') \
+        if submissions.has_next else None
+    submissions_prev_url = url_for('main.view_group', group_id=group_id, page=page,
+                                   submissions_page=submissions.prev_cursor, _anchor='submissions') \
+        if submissions.has_prev else None
 
     return render_template('view_group.html', title=group.name, group=group, form=form,
-                         links=links.items, next_url=next_url, prev_url=prev_url, get_form=get_form, all_forms=all_forms)
+                         links=links.items, next_url=next_url, prev_url=prev_url,
+                         submissions=submissions.items, submissions_next_url=submissions_next_url,
+                         submissions_prev_url=submissions_prev_url)
 
 @bp.route('/group/<int:group_id>/export')
 @login_required
 def export_group(group_id):
-    """Export group submissions to Excel"""
+    """
+    Export group submissions to Excel, or CSV / JSON Lines with ?format=csv|ndjson
+
+    ?format=xlsx_photos adds a thumbnail of each photo to the spreadsheet.
+    Pass ?since=<cursor> for only the changes since an earlier Excel export.
+    """
     group = db.first_or_404(
         sa.select(Group).where(Group.id == group_id).where(Group.user_id == current_user.id)
     )
 
+    kind = request.args.get('format', 'xlsx')
+    if kind not in EXPORT_KINDS or kind == 'photos':
+        abort(400)
+
+    if 'since' in request.args:
+        if kind != 'xlsx':
+            abort(400)
+        since = _export_cursor_arg()
+        forms, tombstones, cursor = group_changes(group_id, since,
+                                                  batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+        response = streaming_download(stream_group_changes(forms, tombstones), XLSX_MIMETYPE,
+                                      f"{group.name.replace(' ', '_')}_changes.xlsx")
+        response.headers['X-Export-Cursor'] = format_export_cursor(cursor)
+        return response
+
+    has_forms = db.session.scalar(sa.select(sa.exists().where(Form.group_id == group_id)))
+    if not has_forms:
+        flash('No submissions to export for this group.', 'warning')
+        return redirect(url_for('main.view_group', group_id=group_id))
+
+    # Generate filename
+    extension, mimetype, suffix = EXPORT_KINDS[kind]
+    filename = f"{group.name.replace(' ', '_')}_{suffix}.{extension}"
+
+    # Serve an identical earlier export straight from disk
+    version = group_version(group_id)
+    cached = cached_export(group_id, kind, version)
+    if cached:
+        return send_file(cached, mimetype=mimetype, as_attachment=True,
+                         download_name=filename, conditional=True)
+
+    if kind in RECORD_WRITERS:
+        rows = iter_group_records(group_id, current_app.config['EXPORT_BATCH_SIZE'])
+        chunks = cache_export_stream(group_id, kind, version, RECORD_WRITERS[kind](rows))
+        return streaming_download(chunks, mimetype, filename)
+
+    if kind == 'xlsx_photos':
+        forms = iter_group_forms(group_id, current_app.config['EXPORT_BATCH_SIZE'])
+        chunks = stream_group_export_with_photos(
+            group, forms, uploads, current_app.config['THUMBNAIL_PATH'],
+            current_app.config['EXPORT_THUMBNAIL_SIZE'], process_pool(current_app.config['IMAGE_WORKERS'])
+        )
+        return streaming_download(cache_export_stream(group_id, kind, version, chunks), mimetype, filename)
+
+    if current_app.config['EXPORT_STREAMING']:
+        forms = iter_group_forms(group_id, current_app.config['EXPORT_BATCH_SIZE'])
+        chunks = cache_export_stream(group_id, kind, version, stream_group_export(group, forms))
+        return streaming_download(chunks, mimetype, filename)
+
     # Get all forms for this group
     query = sa.select(Form).where(Form.group_id == group_id).order_by(Form.submitted_at.desc())
     forms = db.session.scalars(query).all()
 
-    if not forms:
-        flash('No submissions to export for this group.', 'warning')
-        return redirect(url_for('main.view_group', group_id=group_id))
-
     # Create Excel file
     excel_file = create_group_export(group, forms)
 
-    # Generate filename
-    filename = f"{group.name.replace(' ', '_')}_submissions.xlsx"
-
     return send_file(
         excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        mimetype=XLSX_MIMETYPE,
         as_attachment=True,
         download_name=filename
     )
@@ -279,55 +496,51 @@ def export_group(group_id):
 @bp.route('/group/<int:group_id>/export-photos')
 @login_required
 def export_group_photos(group_id):
-    """Export all group submission photos as a ZIP file"""
-    import zipfile
-    from io import BytesIO
-
+    """Export all group submission photos as a ZIP file; pass ?since=<cursor> for only the changes"""
     group = db.first_or_404(
         sa.select(Group).where(Group.id == group_id).where(Group.user_id == current_user.id)
     )
 
-    # Get all forms for this group
-    query = sa.select(Form).where(Form.group_id == group_id).order_by(Form.submitted_at.desc())
-    forms = db.session.scalars(query).all()
-
-    if not forms:
+    if 'since' in request.args:
+        since = _export_cursor_arg()
+        forms, tombstones, cursor = group_changes(
+            group_id, since, columns=PHOTO_COLUMNS,
+            batch_size=current_app.config['EXPORT_BATCH_SIZE']
+        )
+        chunks = stream_group_photos(forms, uploads,
+                                     current_app.config['EXPORT_READAHEAD'],
+                                     deleted=(tombstone.form_id for tombstone in tombstones))
+        response = streaming_download(chunks, 'application/zip',
+                                      f"{group.name.replace(' ', '_')}_photo_changes.zip")
+        response.headers['X-Export-Cursor'] = format_export_cursor(cursor)
+        return response
+
+    has_forms = db.session.scalar(sa.select(sa.exists().where(Form.group_id == group_id)))
+    if not has_forms:
         flash('No submissions to export for this group.', 'warning')
         return redirect(url_for('main.view_group', group_id=group_id))
 
-    # Create ZIP file in memory
-    zip_buffer = BytesIO()
-    files_added = 0
-
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for form in forms:
-            # Get image filename
-            image_path = os.path.join(current_app.config['UPLOAD_PATH'], form.id)
-
-            if os.path.exists(image_path):
-                # Create filename as FirstName_LastName_id
-                filename = f"{form.first_name}_{form.last_name}_{form.id[:8]}"
-
-                # Get file extension
-                kind = filetype.guess(image_path)
-                if kind:
-                    filename += f".{kind.extension}"
-                else:
-                    filename += ".png"  # Default to PNG if type can't be determined
+    # Generate filename
+    download_filename = f"{group.name.replace(' ', '_')}_photos.zip"
 
-                # Add file to ZIP
-                with open(image_path, 'rb') as f:
-                    zip_file.writestr(filename, f.read())
-                    files_added += 1
+    # Serve an identical earlier export straight from disk, before reading any rows
+    version = group_version(group_id)
+    cached = cached_export(group_id, 'photos', version)
+    if cached:
+        return send_file(cached, mimetype='application/zip', as_attachment=True,
+                         download_name=download_filename, conditional=True)
 
-    if files_added == 0:
+    forms = photo_export_rows(group_id)
+    if not any(uploads.exists(form) for form in forms):
         flash('No photos found to export for this group.', 'warning')
         return redirect(url_for('main.view_group', group_id=group_id))
 
-    zip_buffer.seek(0)
+    if current_app.config['EXPORT_STREAMING']:
+        chunks = stream_group_photos(forms, uploads, current_app.config['EXPORT_READAHEAD'])
+        chunks = cache_export_stream(group_id, 'photos', version, chunks)
+        return streaming_download(chunks, 'application/zip', download_filename)
 
-    # Generate filename
-    download_filename = f"{group.name.replace(' ', '_')}_photos.zip"
+    zip_buffer, _ = create_photo_export(forms, uploads)
 
     return send_file(
         zip_buffer,
@@ -336,6 +549,64 @@ def export_group_photos(group_id):
         download_name=download_filename
     )
 
+def _export_cursor_arg():
+    """The ?since= cursor of an incremental export; an empty value means from the start"""
+    try:
+        return parse_export_cursor(request.args.get('since', ''))
+    except ValueError:
+        abort(400)
+
+@bp.route('/group/<int:group_id>/export-jobs', methods=['POST'])
+@login_required
+def create_export_job(group_id):
+    """Start a background export of a group; kind is one of EXPORT_KINDS"""
+    group = db.first_or_404(
+        sa.select(Group).where(Group.id == group_id).where(Group.user_id == current_user.id)
+    )
+
+    kind = request.values.get('kind', 'xlsx')
+    if kind not in EXPORT_KINDS:
+        return jsonify(error=f'Unknown export kind: {kind}'), 400
+
+    job = submit_export_job(group, kind, current_user.id)
+    return jsonify(_export_job_status(job)), 202
+
+@bp.route('/export-jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    """Progress of a background export"""
+    job = get_export_job(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        abort(404)
+    return jsonify(_export_job_status(job))
+
+@bp.route('/export-jobs/<job_id>/download')
+@login_required
+def download_export_job(job_id):
+    """Download a finished export; Range requests let interrupted downloads resume"""
+    job = get_export_job(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        abort(404)
+    if job['status'] != 'done':
+        return jsonify(_export_job_status(job)), 409
+
+    return send_file(
+        export_job_artifact(job),
+        mimetype=job['mimetype'],
+        as_attachment=True,
+        download_name=job['download_name'],
+        conditional=True
+    )
+
+def _export_job_status(job):
+    fields = ('id', 'kind', 'group_id', 'status', 'rows_done', 'rows_total',
+              'photos_done', 'photos_total', 'error', 'created_at', 'finished_at')
+    status = {field: job[field] for field in fields}
+    status['status_url'] = url_for('main.export_job_status', job_id=job['id'])
+    status['download_url'] = url_for('main.download_export_job', job_id=job['id']) \
+        if job['status'] == 'done' else None
+    return status
+
 @bp.route('/link/<link_id>/delete', methods=['POST'])
 @login_required
 def delete_link(link_id):
@@ -349,18 +620,8 @@ def delete_link(link_id):
         flash('Link not found or already deleted.', 'warning')
         return redirect(url_for('main.index'))
 
-    # Delete associated forms (there might be multiple)
-    forms = db.session.scalars(sa.select(Form).where(Form.link_id == link_id)).all()
-    for form in forms:
-        # Delete the image file
-        image_path = os.path.join(current_app.config['UPLOAD_PATH'], form.id)
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        db.session.delete(form)
-
-    # Delete the link
-    db.session.delete(link)
-    db.session.commit()
+    # Deletes the link with its forms; the image files go once no form references them
+    delete_forms(current_user, link_ids=[link_id])
     flash('Link deleted successfully!')
     return redirect(url_for('main.index'))
 
@@ -376,23 +637,9 @@ def delete_group_link(group_id, link_id):
         sa.select(Link).where(Link.id == link_id).where(Link.group_id == group_id)
     )
 
-    # Delete associated forms if they exist
-    forms = db.session.scalars(sa.select(Form).where(Form.link_id == link_id)).all()
-    for form in forms:
-        # Delete the image file
-        image_path = os.path.join(current_app.config['UPLOAD_PATH'], form.id)
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        # Decrement group count
-        if group.current_count > 0:
-            group.current_count -= 1
-        db.session.delete(form)
-
-    # Delete the link
-    db.session.delete(link)
-    db.session.commit()
+    delete_forms(current_user, link_ids=[link.id])
     flash('Link deleted successfully!')
-    return redirect(url_for('main.view_group', group_id=group_id))
+    return redirect(url_for('main.view_group', group_id=group.id))
 
 @bp.route('/form/<form_id>/delete', methods=['POST'])
 @login_required
@@ -414,21 +661,41 @@ def delete_form(form_id):
         )
         group_id = None
 
-    # Delete the image file
-    image_path = os.path.join(current_app.config['UPLOAD_PATH'], form.id)
-    if os.path.exists(image_path):
-        os.remove(image_path)
-
-    # Decrement group count if it's a group form
-    if form.group:
-        if form.group.current_count > 0:
-            form.group.current_count -= 1
-
-    db.session.delete(form)
-    db.session.commit()
+    delete_forms(current_user, form_ids=[form.id])
     flash('Submission deleted successfully!')
 
     if group_id:
         return redirect(url_for('main.view_group', group_id=group_id))
     else:
-        return redirect(url_for('main.index'))
\ No newline at end of file
+        return redirect(url_for('main.index'))
+
+@bp.route('/forms/delete', methods=['POST'])
+@login_required
+def delete_forms_bulk():
+    """
+    Delete many submissions at once: form_ids, link_ids (the links go too) or a whole group_id
+
+    Takes a JSON body or form fields (form_id, link_id repeated). Ids the
+    user does not own are skipped; the counts say what was deleted.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    elif not isinstance(data, dict):
+        return jsonify(error='The JSON body must be an object'), 400
+    form_ids = data.get('form_ids') or request.form.getlist('form_id')
+    link_ids = data.get('link_ids') or request.form.getlist('link_id')
+    group_id = data.get('group_id') or request.form.get('group_id')
+    if not (form_ids or link_ids or group_id):
+        return jsonify(error='Give form_ids, link_ids or group_id'), 400
+    if not isinstance(form_ids, list) or not isinstance(link_ids, list) or \
+            not all(isinstance(value, str) for value in form_ids + link_ids):
+        return jsonify(error='form_ids and link_ids must be lists of ids'), 400
+    if group_id is not None:
+        try:
+            group_id = int(group_id)
+        except (TypeError, ValueError):
+            return jsonify(error='group_id must be a number'), 400
+
+    forms_deleted, links_deleted = delete_forms(current_user, form_ids=form_ids, link_ids=link_ids, group_id=group_id)
+    return jsonify(forms_deleted=forms_deleted, links_deleted=links_deleted)
@@ -118,13 +118,67 @@ class Form(db.Model):
         sa.ForeignKey(Group.id), index=True
     )
     submitted_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), index=True, default=lambda: datetime.now(timezone.utc))
+    # Detected once when the photo is uploaded, so it is never sniffed again
+    image_mime: so.Mapped[Optional[str]] = so.mapped_column(sa.String(100))
+    image_extension: so.Mapped[Optional[str]] = so.mapped_column(sa.String(10))
+    image_size: so.Mapped[Optional[int]] = so.mapped_column()
+    image_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64), index=True)  # SHA-256, hex
+    # The unmodified upload of a normalized photo, kept in the cold tier with UPLOAD_KEEP_ORIGINALS
+    image_original_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64), index=True)
+    # When normalization last replaced the photo; None if it is still the one submitted
+    image_updated_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True))
 
     link: so.Mapped[Link] = so.relationship(foreign_keys=[link_id])
     group: so.Mapped[Optional[Group]] = so.relationship(back_populates='forms')
 
+    __table_args__ = (
+        # Group exports read a group's forms in submitted_at order
+        sa.Index('ix_form_group_id_submitted_at', 'group_id', 'submitted_at'),
+        # ...and export_cache.group_version asks for the latest photo change
+        sa.Index('ix_form_group_id_image_updated_at', 'group_id', 'image_updated_at'),
+    )
+
     def __repr__(self):
         return '<Form {}>'.format(self.id)
 
+class FormTombstone(db.Model):
+    """Marker left behind when a group submission is deleted, for incremental exports"""
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    form_id: so.Mapped[str] = so.mapped_column(sa.String(22))
+    group_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Group.id))
+    deleted_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        sa.Index('ix_form_tombstone_group_id_deleted_at', 'group_id', 'deleted_at'),
+    )
+
+    def __repr__(self):
+        return '<FormTombstone {}>'.format(self.form_id)
+
+class ImageJob(db.Model):
+    """Queued image work for a stored photo, run off the request by image_worker.py"""
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    kind: so.Mapped[str] = so.mapped_column(sa.String(20))  # See app.image_jobs.IMAGE_JOB_KINDS
+    image_hash: so.Mapped[str] = so.mapped_column(sa.String(64))
+    status: so.Mapped[str] = so.mapped_column(sa.String(20), default='queued')  # queued, running, done or failed
+    attempts: so.Mapped[int] = so.mapped_column(default=0)
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    worker: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
+    created_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    run_after: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    started_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True))
+    finished_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True))
+    wait_seconds: so.Mapped[Optional[float]] = so.mapped_column()  # Queued until the last attempt started
+    run_seconds: so.Mapped[Optional[float]] = so.mapped_column()  # Duration of the last attempt
+
+    __table_args__ = (
+        # Workers claim the oldest runnable job of each status
+        sa.Index('ix_image_job_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return '<ImageJob {} {}>'.format(self.kind, self.image_hash)
+
 @login.user_loader
 def load_user(id):
     return db.session.get(User, int(id))
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""Keyset pagination of list views, so a page costs the same however deep it is"""
+from collections import namedtuple
+from datetime import datetime
+import base64
+import binascii
+import json
+import sqlalchemy as sa
+from app import db
+
+# One page of a keyset-paginated query. next_cursor / prev_cursor are opaque
+# tokens for the neighbouring pages; a cursor of None with has_next / has_prev
+# set means the first page. total is None unless it was asked for.
+KeysetPage = namedtuple('KeysetPage', ['items', 'has_next', 'has_prev', 'next_cursor', 'prev_cursor', 'total'])
+
+
+def keyset_paginate(query, key, cursor=None, per_page=20, count=False):
+    """
+    Fetch one page of a select, newest first, positioned by a cursor instead of an OFFSET
+
+    The page is a range scan on the key's index that starts at the cursor, and
+    one extra row says whether there is another page, so no row before the
+    page is read and no COUNT(*) is needed. Rows added or deleted between
+    requests never shift a page or repeat an item.
+
+    Args:
+        query: Select of ORM objects or named columns, without an ORDER BY
+        key: (timestamp column, id column) the rows are ordered by; the id breaks ties
+        cursor: Token from a previous page's next_cursor / prev_cursor; empty or
+            invalid tokens (such as an old ?page=2 link) give the first page
+        per_page: Rows per page
+        count: Also count every row of the query into total (one more query)
+
+    Returns:
+        KeysetPage
+    """
+    timestamp, id_ = key
+    total = db.session.scalar(sa.select(sa.func.count()).select_from(query.subquery())) if count else None
+    try:
+        direction, position = parse_cursor(cursor)
+    except ValueError:
+        direction, position = 'next', None
+
+    if direction == 'next':
+        order = (timestamp.desc(), id_.desc())
+        if position is not None:
+            query = query.where(sa.or_(timestamp < position[0],
+                                       sa.and_(timestamp == position[0], id_ < position[1])))
+    else:
+        # Walk back up towards the newest rows, then put the page in display order
+        order = (timestamp.asc(), id_.asc())
+        query = query.where(sa.or_(timestamp > position[0],
+                                   sa.and_(timestamp == position[0], id_ > position[1])))
+
+    rows = db.session.execute(query.order_by(*order).limit(per_page + 1)).all()
+    # A select of one entity gives rows of that object; a select of columns gives the rows themselves
+    items = [row[0] if len(row) == 1 else row for row in rows]
+    more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'prev':
+        items.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, position is not None
+
+    first = _position(items[0], timestamp, id_) if items else None
+    last = _position(items[-1], timestamp, id_) if items else None
+    return KeysetPage(
+        items=items,
+        has_next=has_next,
+        has_prev=has_prev,
+        next_cursor=format_cursor('next', last) if has_next and last else None,
+        prev_cursor=format_cursor('prev', first) if has_prev and first else None,
+        total=total,
+    )
+
+
+def parse_cursor(token):
+    """
+    Decode a page cursor into (direction, (timestamp, id))
+
+    An empty token is the first page. Raises ValueError if the token is not a cursor.
+    """
+    if not token:
+        return 'next', None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if data['d'] not in ('next', 'prev'):
+            raise ValueError(data['d'])
+        return data['d'], (datetime.fromisoformat(data['k'][0]), data['k'][1])
+    except (binascii.Error, KeyError, IndexError, TypeError, ValueError) as exc:
+        raise ValueError('Invalid page cursor') from exc
+
+
+def format_cursor(direction, position):
+    """Encode a direction and (timestamp, id) as an opaque URL-safe token"""
+    data = {'d': direction, 'k': [position[0].isoformat(), position[1]]}
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _position(item, timestamp, id_):
+    return getattr(item, timestamp.key), getattr(item, id_.key)
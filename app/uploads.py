@@ -0,0 +1,648 @@
+"""Content-addressed store for uploaded photos, on local disk or an S3-compatible bucket"""
+from contextlib import closing
+from datetime import datetime, timezone
+import errno
+import hashlib
+from io import BytesIO
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import filetype
+import sqlalchemy as sa
+from flask import current_app
+from app import db
+from app.models import Form
+from app.images import make_derivatives, normalize_image
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Bytes copied at a time; the first chunk is enough to detect the type
+
+
+def blob_path(root, image_hash):
+    """Where the photo with this SHA-256 is stored locally: root/ab/cd/abcd..."""
+    return os.path.join(root, *blob_key(image_hash).split('/'))
+
+
+def blob_key(image_hash):
+    """Storage key of the photo with this SHA-256: ab/cd/abcd..."""
+    return f'{image_hash[:2]}/{image_hash[2:4]}/{image_hash}'
+
+
+def derivative_key(image_hash, size):
+    """Storage key of the size x size WebP copy of a photo, next to the original"""
+    return f'{blob_key(image_hash)}_{size}.webp'
+
+
+def file_metadata(path):
+    """
+    Detect the type of the file at path and hash it in one read
+
+    Returns:
+        Dict of the Form image_* column values, or None if the file is missing
+    """
+    digest = hashlib.sha256()
+    size = 0
+    header = b''
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                if not header:
+                    header = chunk
+                digest.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        return None
+    kind = filetype.guess(header)
+    return {
+        'image_mime': kind.mime if kind else None,
+        'image_extension': kind.extension if kind else None,
+        'image_size': size,
+        'image_hash': digest.hexdigest(),
+    }
+
+
+class LocalStorage:
+    """Storage backend keeping files in a directory on this machine"""
+
+    def __init__(self, root):
+        self.root = root
+        # Uploads are written here first, on the same filesystem so moving them into place is a rename
+        self.staging_dir = os.path.join(root, '.staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def local_path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def open(self, key):
+        """Binary file object for reading, or None if there is no such file"""
+        try:
+            return open(self.local_path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, stream, mimetype=None):
+        # Write then rename so readers never see a partial file
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f'{path}.{uuid.uuid4().hex}.part'
+        try:
+            with open(partial, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def store_file(self, key, path, mimetype=None):
+        """Move the file at path to key; an atomic rename when both are on the same filesystem"""
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                raise
+            # A cold tier on another disk; copy under a temporary name instead
+            with open(path, 'rb') as f:
+                self.save(key, f, mimetype)
+
+    def touch(self, key):
+        """Bump the modification time; returns False if there is no such file"""
+        try:
+            os.utime(self.local_path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def modified_at(self, key):
+        """Modification time in seconds since the epoch, or None if there is no such file"""
+        try:
+            return os.stat(self.local_path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key, mimetype=None, disposition=None):
+        """Local files have no direct URL; they are sent by the app"""
+        return None
+
+    def list_files(self):
+        """Yield (key, size, modified_at) for every file, in key order"""
+        yield from self._list_files(self.root, '')
+
+    def _list_files(self, directory, prefix):
+        with os.scandir(directory) as it:
+            # Sort a directory as if by its keys' next character, '/'
+            entries = sorted(it, key=lambda entry: entry.name + '/' if entry.is_dir() else entry.name)
+        for entry in entries:
+            if entry.is_dir():
+                yield from self._list_files(entry.path, f'{prefix}{entry.name}/')
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield prefix + entry.name, stat.st_size, stat.st_mtime
+
+
+class S3Storage:
+    """
+    Storage backend keeping files as objects in an S3-compatible bucket
+
+    One boto3 client is shared by every thread, with a connection pool of
+    max_connections. Files larger than multipart_threshold are uploaded in
+    parts. Photos are served by redirecting to a presigned URL, so the bytes
+    never pass through the app. Set endpoint_url to use MinIO, a local
+    stand-in server, or another S3-compatible service.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key_id=None,
+                 secret_access_key=None, max_connections=10, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, url_expiry=300, storage_class=None):
+        if boto3 is None:
+            raise RuntimeError("UPLOAD_STORAGE = 's3' needs boto3: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging_dir = None  # Uploads are written to the system temporary directory first
+        self.url_expiry = url_expiry
+        self.storage_class = storage_class
+        self._client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=BotoConfig(
+                max_pool_connections=max_connections,
+                retries={'mode': 'standard'},
+                # Stand-in servers rarely support bucket subdomains
+                s3={'addressing_style': 'path' if endpoint_url else 'auto'},
+            ),
+        )
+        self._transfer = TransferConfig(multipart_threshold=multipart_threshold,
+                                        multipart_chunksize=multipart_chunksize,
+                                        max_concurrency=max_connections)
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def open(self, key):
+        """Streaming body of the object, or None if there is no such object"""
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+        except ClientError as exc:
+            if _missing(exc):
+                return None
+            raise
+
+    def save(self, key, stream, mimetype=None):
+        self._client.upload_fileobj(stream, self.bucket, self.prefix + key,
+                                    ExtraArgs=self._extra_args(mimetype), Config=self._transfer)
+
+    def store_file(self, key, path, mimetype=None):
+        """Upload the local file at path to key; the object appears only once it is complete"""
+        self._client.upload_file(path, self.bucket, self.prefix + key,
+                                 ExtraArgs=self._extra_args(mimetype), Config=self._transfer)
+
+    def touch(self, key):
+        """Bump the object's LastModified by copying it onto itself; returns False if it is missing"""
+        head = self._head(key)
+        if head is None:
+            return False
+        self._client.copy_object(
+            Bucket=self.bucket, Key=self.prefix + key,
+            CopySource={'Bucket': self.bucket, 'Key': self.prefix + key},
+            MetadataDirective='REPLACE', ContentType=head.get('ContentType', 'binary/octet-stream'),
+            Metadata=head.get('Metadata', {}), **self._extra_args(None),
+        )
+        return True
+
+    def modified_at(self, key):
+        head = self._head(key)
+        return head['LastModified'].timestamp() if head else None
+
+    def delete(self, key):
+        self._client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def url(self, key, mimetype=None, disposition=None):
+        """A presigned GET URL that expires after url_expiry seconds"""
+        params = {'Bucket': self.bucket, 'Key': self.prefix + key}
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        if disposition:
+            params['ResponseContentDisposition'] = disposition
+        return self._client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    def list_files(self):
+        """Yield (key, size, modified_at) for every object under the prefix, in key order"""
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['Size'], item['LastModified'].timestamp()
+
+    def _extra_args(self, mimetype):
+        extra = {}
+        if mimetype:
+            extra['ContentType'] = mimetype
+        if self.storage_class:
+            extra['StorageClass'] = self.storage_class
+        return extra
+
+    def _head(self, key):
+        try:
+            return self._client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as exc:
+            if _missing(exc):
+                return None
+            raise
+
+
+def _missing(exc):
+    return exc.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_backend(config, cold=False):
+    """The storage backend selected by UPLOAD_STORAGE; with cold, the one originals are kept in"""
+    if config['UPLOAD_STORAGE'] == 'local':
+        return LocalStorage(config['UPLOAD_ORIGINALS_PATH'] if cold else config['UPLOAD_PATH'])
+    if config['UPLOAD_STORAGE'] == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config['S3_ORIGINALS_PREFIX'] if cold else config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            access_key_id=config['S3_ACCESS_KEY_ID'],
+            secret_access_key=config['S3_SECRET_ACCESS_KEY'],
+            max_connections=config['S3_MAX_CONNECTIONS'],
+            multipart_threshold=config['S3_MULTIPART_THRESHOLD'],
+            multipart_chunksize=config['S3_MULTIPART_CHUNKSIZE'],
+            url_expiry=int(config['S3_URL_EXPIRY'].total_seconds()),
+            storage_class=config['S3_ORIGINALS_STORAGE_CLASS'] if cold else None,
+        )
+    raise ValueError(f"Unknown UPLOAD_STORAGE {config['UPLOAD_STORAGE']!r}")
+
+
+class UploadStore:
+    """
+    Uploaded photos, stored once per content hash in the configured backend
+
+    Keys are sharded by the first two byte pairs of the SHA-256 (ab/cd/<hash>)
+    so no directory grows large. Forms share a file when their photos are
+    identical; the file is reference counted through the indexed
+    Form.image_hash column and removed once no form points at it.
+
+    Forms from before the store was introduced have no hash, or have one but
+    were not yet moved by migrate_uploads.py; their photo is still found
+    under their form id.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['uploads'] = create_backend(app.config)
+        app.extensions['uploads_cold'] = \
+            create_backend(app.config, cold=True) if app.config['UPLOAD_KEEP_ORIGINALS'] else None
+
+    @property
+    def backend(self):
+        return current_app.extensions['uploads']
+
+    @property
+    def cold_backend(self):
+        """Where unmodified originals of normalized photos are kept, or None if they are not"""
+        return current_app.extensions['uploads_cold']
+
+    def keys(self, form):
+        """Where a form's photo may be stored, most likely first; form is anything with id and image_hash"""
+        return [blob_key(form.image_hash), form.id] if form.image_hash else [form.id]
+
+    def find(self, form):
+        """Key of a form's stored photo, or None if it has none"""
+        backend = self.backend
+        for key in self.keys(form):
+            if backend.exists(key):
+                return key
+        return None
+
+    def exists(self, form):
+        return self.find(form) is not None
+
+    def path(self, form):
+        """Local path of a form's photo, or None if it is missing or not stored on this machine"""
+        key = self.find(form)
+        return self.backend.local_path(key) if key else None
+
+    def open(self, form):
+        """Binary file object of a form's photo, or None if it has none"""
+        return read_first(self.backend, self.keys(form))
+
+    def source(self, form):
+        """Local path of a form's photo, or its bytes when stored remotely; None if it has none"""
+        return self._source(self.keys(form))
+
+    def source_for_hash(self, image_hash):
+        """Like source(), for the stored photo with this SHA-256"""
+        return self._source([blob_key(image_hash)])
+
+    def _source(self, keys):
+        # Worker processes cannot use the backend, so they get a path or the bytes
+        backend = self.backend
+        for key in keys:
+            path = backend.local_path(key)
+            if path is not None:
+                if os.path.exists(path):
+                    return path
+                continue
+            photo = backend.open(key)
+            if photo is not None:
+                with closing(photo) as f:
+                    return f.read()
+        return None
+
+    def url(self, form, mimetype=None, disposition=None):
+        """
+        Direct URL of a form's photo when the backend serves files itself, else None
+
+        Backends with URLs only ever hold photos saved through the store, so
+        the photo is at its content key and no lookup is needed.
+        """
+        return self.backend.url(self.keys(form)[0], mimetype, disposition)
+
+    def derivative_path(self, image_hash, size):
+        """Local path of a stored derivative, or None if it is missing or not stored on this machine"""
+        key = derivative_key(image_hash, size)
+        backend = self.backend
+        return backend.local_path(key) if backend.exists(key) else None
+
+    def derivative_url(self, image_hash, size):
+        """Direct URL of a stored derivative when the backend serves files itself, else None (also when it is missing)"""
+        key = derivative_key(image_hash, size)
+        backend = self.backend
+        url = backend.url(key, 'image/webp')
+        # Derivatives are made after the submission, so the URL may not point at anything yet
+        return url if url and backend.exists(key) else None
+
+    def create_derivatives(self, image_hash, source, pool):
+        """
+        Make and store whichever IMAGE_DERIVATIVE_SIZES copies of a photo are missing
+
+        The images are encoded on pool (see app.images.process_pool); source is
+        the photo's local path or its bytes.
+
+        Returns:
+            The sizes that were stored
+        """
+        backend = self.backend
+        sizes = [size for size in current_app.config['IMAGE_DERIVATIVE_SIZES']
+                 if not backend.exists(derivative_key(image_hash, size))]
+        if not sizes:
+            return []
+        derivatives = pool.submit(make_derivatives, source, sizes,
+                                  current_app.config['IMAGE_DERIVATIVE_QUALITY']).result()
+        for size, data in derivatives.items():
+            backend.save(derivative_key(image_hash, size), BytesIO(data), 'image/webp')
+        return list(derivatives)
+
+    def stage(self, stream, allowed_extensions, max_size):
+        """
+        Copy an uploaded file to a temporary file, checking and hashing it on the way
+
+        The type is detected from the first chunk before anything is written,
+        and the size and SHA-256 are worked out while the rest is copied, so
+        the upload is read once and never held in memory whole.
+
+        Returns:
+            StagedUpload, to be passed to save() or discarded
+
+        Raises:
+            ValueError: if the file is not one of allowed_extensions or is larger than max_size
+        """
+        header = stream.read(UPLOAD_CHUNK_SIZE)
+        kind = filetype.guess(header)
+        if kind is None or kind.extension not in allowed_extensions:
+            raise ValueError("Invalid image format.")
+
+        fd, path = tempfile.mkstemp(suffix='.part', dir=self.backend.staging_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                chunk = header
+                while chunk:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"Image is larger than {max_size // (1024 * 1024)} MB.")
+                    digest.update(chunk)
+                    f.write(chunk)
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        except BaseException:
+            os.remove(path)
+            raise
+        return StagedUpload(path, kind.mime, kind.extension, size, digest.hexdigest())
+
+    def normalize_stored(self, image_hash, pool):
+        """
+        Replace a stored photo with a copy that fits in IMAGE_MAX_DIMENSION, made on pool
+
+        The copy is upright and re-encoded as JPEG at IMAGE_NORMALIZE_QUALITY
+        (see app.images.normalize_image) and stored under its own hash, and the
+        forms using the photo are pointed at it in the session, with their
+        image_updated_at set so cached copies are revalidated; the caller
+        commits. With UPLOAD_KEEP_ORIGINALS the original is copied to the cold
+        tier and recorded as their image_original_hash. The original stays in
+        the store until the caller releases it.
+
+        Returns:
+            The copy's hash, or None if the photo was left alone
+        """
+        source = self.source_for_hash(image_hash)
+        if source is None:
+            raise FileNotFoundError(f'Photo {image_hash} is not stored')
+        backend = self.backend
+        fd, path = tempfile.mkstemp(suffix='.part', dir=backend.staging_dir)
+        os.close(fd)
+        try:
+            normalized = pool.submit(normalize_image, source, path, current_app.config['IMAGE_MAX_DIMENSION'],
+                                     current_app.config['IMAGE_NORMALIZE_QUALITY']).result()
+            if normalized is None:
+                return None
+            metadata = file_metadata(path)
+            key = blob_key(metadata['image_hash'])
+            if not backend.touch(key):
+                backend.store_file(key, path, metadata['image_mime'])
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+        cold = self.cold_backend
+        if cold is not None and not cold.touch(blob_key(image_hash)):
+            mime = db.session.scalar(sa.select(Form.image_mime).where(Form.image_hash == image_hash).limit(1))
+            with (open(source, 'rb') if isinstance(source, str) else BytesIO(source)) as f:
+                cold.save(blob_key(image_hash), f, mime)
+        db.session.execute(
+            sa.update(Form).where(Form.image_hash == image_hash).values(
+                image_original_hash=image_hash if cold is not None else None,
+                image_updated_at=datetime.now(timezone.utc), **metadata)
+        )
+        return metadata['image_hash']
+
+    def save(self, staged):
+        """
+        Store a staged upload under its hash and drop its temporary file
+
+        If the photo is already stored only its modification time is bumped,
+        which keeps release() from removing it while the new form is saved.
+        """
+        backend = self.backend
+        key = blob_key(staged.image_hash)
+        try:
+            if not backend.touch(key):
+                backend.store_file(key, staged.path, staged.mime)
+        finally:
+            staged.discard()
+        return key
+
+    def release(self, form_id, image_hash, original_hash=None):
+        """Drop a deleted form's reference to its photo (and to its original in the cold tier)"""
+        self.release_many([(form_id, image_hash, original_hash)])
+
+    def release_many(self, photos):
+        """
+        Drop deleted forms' references to their photos
+
+        photos are (form_id, image_hash, original_hash) tuples; form_id may be
+        None for a photo no form uses any more. Call after the deletion is
+        committed. A file is removed when no other form uses it, unless it was
+        stored within UPLOAD_GRACE_PERIOD, in which case a submission being
+        saved may be about to use it. Which photos are still
+        in use is looked up in batches rather than one query per photo, then
+        each file is checked again by file_unused() just before it is deleted;
+        see there for the one race that remains.
+        """
+        grace_period = current_app.config['UPLOAD_GRACE_PERIOD'].total_seconds()
+        backend = self.backend
+        form_ids = {}
+        for form_id, image_hash, _ in photos:
+            if image_hash:
+                form_ids.setdefault(image_hash, []).append(form_id)
+            else:
+                backend.delete(form_id)
+
+        for image_hash in set(form_ids) - _hashes_in_use(Form.image_hash, form_ids):
+            key = blob_key(image_hash)
+            if backend.modified_at(key) is None:
+                # Not moved into the store yet (migrate_uploads.py)
+                for form_id in form_ids[image_hash]:
+                    if form_id:
+                        backend.delete(form_id)
+            elif file_unused(backend, key, sa.exists().where(Form.image_hash == image_hash), grace_period):
+                backend.delete(key)
+                for size in current_app.config['IMAGE_DERIVATIVE_SIZES']:
+                    backend.delete(derivative_key(image_hash, size))
+
+        cold = self.cold_backend
+        originals = {original_hash for _, _, original_hash in photos if original_hash}
+        if cold is None or not originals:
+            return
+        for original_hash in originals - _hashes_in_use(Form.image_original_hash, originals):
+            in_use = sa.exists().where(Form.image_original_hash == original_hash)
+            if file_unused(cold, blob_key(original_hash), in_use, grace_period):
+                cold.delete(blob_key(original_hash))
+
+
+def file_unused(backend, key, in_use, grace_period):
+    """
+    Whether a stored file may be deleted right now: nothing refers to it and it is older than grace_period
+
+    in_use is an EXISTS clause for the forms that would refer to the file, or
+    None if none can. Call it immediately before the delete. The database is
+    read first and the modification time last, because save() bumps the time
+    before it commits its form: a save that got here first is seen either
+    way. A save whose bump lands in the moment between the final stat (a HEAD
+    request on S3) and the delete still loses its file; closing that would
+    take a lock the storage backends do not offer.
+    """
+    if in_use is not None and db.session.scalar(sa.select(in_use)):
+        return False
+    modified_at = backend.modified_at(key)
+    return modified_at is not None and time.time() - modified_at >= grace_period
+
+
+def hash_batches(column, batch_size=500):
+    """Yield the distinct stored values of a Form hash column in order, in batches"""
+    last_hash = ''
+    while True:
+        hashes = db.session.scalars(
+            sa.select(column)
+            .where(column > last_hash)
+            .distinct()
+            .order_by(column)
+            .limit(batch_size)
+        ).all()
+        if not hashes:
+            return
+        last_hash = hashes[-1]
+        yield hashes
+
+
+def _hashes_in_use(column, hashes, batch_size=500):
+    """The subset of hashes that some form still has in column"""
+    hashes = list(hashes)
+    in_use = set()
+    for start in range(0, len(hashes), batch_size):
+        in_use.update(db.session.scalars(
+            sa.select(column).where(column.in_(hashes[start:start + batch_size])).distinct()
+        ))
+    return in_use
+
+
+class StagedUpload:
+    """An upload copied to a temporary file by UploadStore.stage(), with its detected type, size and hash"""
+
+    def __init__(self, path, mime, extension, size, image_hash):
+        self.path = path
+        self.mime = mime
+        self.extension = extension
+        self.size = size
+        self.image_hash = image_hash
+
+    def discard(self):
+        """Remove the temporary file, unless it was already moved into the store"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_first(backend, keys):
+    """Open the first of keys that exists in backend, or return None if none does"""
+    for key in keys:
+        f = backend.open(key)
+        if f is not None:
+            return closing(f) if not hasattr(f, '__enter__') else f
+    return None
+
+
+uploads = UploadStore()
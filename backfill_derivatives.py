@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Make the WebP derivatives (IMAGE_DERIVATIVE_SIZES) of photos uploaded before
+they were generated at upload time.
+
+Every distinct stored photo is visited once, in batches ordered by hash, and
+only its missing sizes are made. Encoding runs on a process pool with one
+worker per CPU (or IMAGE_WORKERS), so the script can be stopped and re-run.
+Photos without a hash must be backfilled first with backfill_image_metadata.py.
+
+Usage: python backfill_derivatives.py [batch_size]
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from io import BytesIO
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import Form
+from app.images import make_derivatives, process_pool
+from app.uploads import uploads, derivative_key, hash_batches
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    app = create_app()
+
+    with app.app_context():
+        print("\n" + "="*80)
+        print("BACKFILL IMAGE DERIVATIVES")
+        print("="*80)
+
+        sizes = app.config['IMAGE_DERIVATIVE_SIZES']
+        quality = app.config['IMAGE_DERIVATIVE_QUALITY']
+        pool = process_pool(app.config['IMAGE_WORKERS'])
+        window = 2 * (app.config['IMAGE_WORKERS'] or os.cpu_count() or 1)
+        backend = uploads.backend
+
+        made = 0
+        complete = 0
+        missing = []
+        unreadable = []
+        in_flight = {}
+        start = time.perf_counter()
+
+        def store(done):
+            nonlocal made
+            for future in done:
+                image_hash = in_flight.pop(future)
+                derivatives = future.result()
+                if not derivatives:
+                    unreadable.append(image_hash)
+                    continue
+                for size, data in derivatives.items():
+                    backend.save(derivative_key(image_hash, size), BytesIO(data), 'image/webp')
+                made += 1
+
+        print(f"\n📊 Sizes: {', '.join(f'{size}px' for size in sizes)}")
+        for hashes in hash_batches(Form.image_hash, batch_size):
+            for image_hash in hashes:
+                todo = [size for size in sizes if not backend.exists(derivative_key(image_hash, size))]
+                if not todo:
+                    complete += 1
+                    continue
+                source = uploads.source_for_hash(image_hash)
+                if source is None:
+                    missing.append(image_hash)
+                    continue
+                in_flight[pool.submit(make_derivatives, source, todo, quality)] = image_hash
+                # Keep every worker busy without holding many photos in memory
+                if len(in_flight) >= window:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    store(done)
+            print(f"  ✓ {made} photos processed, {complete} already complete "
+                  f"({made / (time.perf_counter() - start):.1f}/s)")
+        store(list(in_flight))
+
+        print(f"\n✅ Made derivatives for {made} photos in {time.perf_counter() - start:.1f}s")
+        print(f"✅ {complete} photos already had every size")
+        if missing:
+            print(f"⚠️  {len(missing)} photos are missing from storage")
+        if unreadable:
+            print(f"⚠️  {len(unreadable)} photos could not be read as images:")
+            for image_hash in unreadable[:20]:
+                print(f"  - {image_hash}")
+
+        print("\n" + "="*80)
+
+
+if __name__ == '__main__':
+    main()
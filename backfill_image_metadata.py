@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Backfill the detected image type, size and hash of submissions made before
+they were recorded at upload time.
+
+Forms are processed in batches ordered by id, each batch written with one
+bulk UPDATE and committed, so the script can be stopped and re-run at any time.
+
+Usage: python backfill_image_metadata.py [batch_size]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import Form
+from app.uploads import file_metadata
+import sqlalchemy as sa
+
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+app = create_app()
+
+with app.app_context():
+    print("\n" + "="*80)
+    print("BACKFILL IMAGE METADATA")
+    print("="*80)
+
+    upload_path = app.config['UPLOAD_PATH']
+    remaining = db.session.scalar(sa.select(sa.func.count(Form.id)).where(Form.image_hash.is_(None)))
+    print(f"\n📊 {remaining} forms have no image metadata")
+
+    updated = 0
+    missing = []
+    last_id = ''
+    while True:
+        form_ids = db.session.scalars(
+            sa.select(Form.id)
+            .where(Form.image_hash.is_(None), Form.id > last_id)
+            .order_by(Form.id)
+            .limit(batch_size)
+        ).all()
+        if not form_ids:
+            break
+        last_id = form_ids[-1]
+
+        values = []
+        for form_id in form_ids:
+            metadata = file_metadata(os.path.join(upload_path, form_id))
+            if metadata is None:
+                missing.append(form_id)
+            else:
+                values.append({'id': form_id, **metadata})
+
+        if values:
+            db.session.execute(sa.update(Form), values)
+        db.session.commit()
+        updated += len(values)
+        print(f"  ✓ {updated}/{remaining} updated")
+
+    print(f"\n✅ Stored metadata for {updated} forms")
+    if missing:
+        print(f"⚠️  {len(missing)} forms have no photo on disk:")
+        for form_id in missing[:20]:
+            print(f"  - {form_id}")
+        if len(missing) > 20:
+            print(f"  ... and {len(missing) - 20} more")
+
+    print("\n" + "="*80)
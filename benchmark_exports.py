@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+"""
+Benchmark the group export paths on synthetic groups of growing size.
+
+Each size gets its own group, seeded with generate_group_submissions.py's fake
+people in a throwaway database and upload folder, so real data is never
+touched. Every export path is timed and its peak Python memory traced, and the
+results are compared with a stored baseline so regressions show up in review.
+Timings depend on the machine, so record the baseline on the one you compare on.
+
+The "route:" cases request each export route through a logged-in test client
+and read the whole body. They run without an app context around the request,
+as under a real server, so a streamed body that outlives the view's database
+session fails them. Any response other than HTTP 200 fails the run.
+
+Usage:
+    python benchmark_exports.py [--sizes 1000,10000] [--photos 500] [--profile]
+                                [--baseline FILE] [--save-baseline]
+
+Examples:
+    # Compare against the stored baseline
+    python benchmark_exports.py
+
+    # Include a million-submission group (seeding takes a while)
+    python benchmark_exports.py --sizes 1000,10000,100000,1000000
+
+    # Record new baseline numbers after an intended change
+    python benchmark_exports.py --save-baseline
+"""
+
+import argparse
+import cProfile
+import gc
+import json
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# Add the app to the path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from config import Config
+from app import db, create_app
+from app.models import Form, Link, Group, User
+from app.export_utils import create_group_export, stream_group_export, iter_group_forms, \
+    iter_group_records, stream_group_csv, stream_group_ndjson, create_photo_export, \
+    stream_group_photos, photo_export_rows, stream_group_export_with_photos
+from app.images import process_pool
+from app.uploads import uploads
+from generate_group_submissions import generate_fake_person
+import sqlalchemy as sa
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+SEED_BATCH = 5000
+REGRESSION_THRESHOLD = 0.10  # Flag anything 10% slower or bigger than the baseline
+
+
+def benchmark_config(workdir):
+    """A config that keeps the database and every data folder inside workdir"""
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+        UPLOAD_PATH = os.path.join(workdir, 'uploads')
+        EXPORT_PATH = os.path.join(workdir, 'exports')
+        EXPORT_CACHE_PATH = os.path.join(workdir, 'export_cache')
+        THUMBNAIL_PATH = os.path.join(workdir, 'thumbnails')
+        EXPORT_CACHE_MAX_BYTES = 0  # Every run builds its export instead of reusing a cached one
+        WTF_CSRF_ENABLED = False
+    return BenchmarkConfig
+
+
+class RouteError(Exception):
+    """An export route answered with something other than a complete HTTP 200 download"""
+
+
+def seed_group(user_id, size, photos, upload_path):
+    """Create a group of `size` fake submissions, the first `photos` of them with a photo"""
+    group = Group(name=f'Benchmark {size}', user_id=user_id, current_count=size)
+    now = datetime.now(timezone.utc)
+    link = Link(created_at=now, end_at=now + timedelta(days=1), user_id=user_id, group=group)
+    db.session.add_all([group, link])
+    db.session.commit()
+    group_id, link_id = group.id, link.id
+
+    for start in range(0, size, SEED_BATCH):
+        db.session.add_all(
+            generate_fake_person(link_id, group_id, upload_path, photo=i < photos)
+            for i in range(start, min(start + SEED_BATCH, size))
+        )
+        db.session.commit()
+        # Keep the identity map from growing with the group
+        db.session.expunge_all()
+        print(f"  seeded {min(start + SEED_BATCH, size)}/{size}", end='\r')
+    print()
+    return group_id
+
+
+def export_cases(app, group_id, client):
+    """
+    The export paths to measure, as (name, callable returning the number of bytes produced)
+
+    The functions run in an app context of their own, as export jobs do; the
+    routes are requested through client, logged in as the group's owner.
+    """
+    config = app.config
+
+    def consume(chunks):
+        return sum(len(chunk) for chunk in chunks)
+
+    def in_app_context(func):
+        def run():
+            with app.app_context():
+                return func()
+        return run
+
+    def route(path):
+        def run():
+            try:
+                response = client.get(path)
+                body = response.get_data()
+            except Exception as exc:
+                raise RouteError(f'GET {path} failed: {type(exc).__name__}: {exc}') from exc
+            if response.status_code != 200:
+                raise RouteError(f'GET {path} returned HTTP {response.status_code}')
+            return len(body)
+        return run
+
+    def xlsx_in_memory():
+        group = db.session.get(Group, group_id)
+        forms = db.session.scalars(
+            sa.select(Form).where(Form.group_id == group_id).order_by(Form.submitted_at.desc())
+        ).all()
+        return len(create_group_export(group, forms).getvalue())
+
+    def xlsx_streaming():
+        group = db.session.get(Group, group_id)
+        return consume(stream_group_export(group, iter_group_forms(group_id, config['EXPORT_BATCH_SIZE'])))
+
+    def xlsx_with_thumbnails():
+        group = db.session.get(Group, group_id)
+        return consume(stream_group_export_with_photos(
+            group, iter_group_forms(group_id, config['EXPORT_BATCH_SIZE']),
+            uploads, config['THUMBNAIL_PATH'], config['EXPORT_THUMBNAIL_SIZE'],
+            process_pool(config['IMAGE_WORKERS'])
+        ))
+
+    def csv():
+        return consume(stream_group_csv(iter_group_records(group_id, config['EXPORT_BATCH_SIZE'])))
+
+    def ndjson():
+        return consume(stream_group_ndjson(iter_group_records(group_id, config['EXPORT_BATCH_SIZE'])))
+
+    def photos_in_memory():
+        buffer, _ = create_photo_export(photo_export_rows(group_id), uploads)
+        return len(buffer.getvalue())
+
+    def photos_streaming():
+        return consume(stream_group_photos(photo_export_rows(group_id), uploads,
+                                           config['EXPORT_READAHEAD']))
+
+    functions = [
+        ('xlsx (in memory)', xlsx_in_memory),
+        ('xlsx (streaming)', xlsx_streaming),
+        ('xlsx + thumbnails', xlsx_with_thumbnails),
+        ('csv', csv),
+        ('ndjson', ndjson),
+        ('photos zip (in memory)', photos_in_memory),
+        ('photos zip (streaming)', photos_streaming),
+    ]
+    routes = [
+        ('route: xlsx', f'/group/{group_id}/export'),
+        ('route: xlsx + thumbnails', f'/group/{group_id}/export?format=xlsx_photos'),
+        ('route: csv', f'/group/{group_id}/export?format=csv'),
+        ('route: xlsx changes', f'/group/{group_id}/export?since='),
+        ('route: photos zip', f'/group/{group_id}/export-photos'),
+        ('route: photos changes', f'/group/{group_id}/export-photos?since='),
+        ('route: all groups xlsx', '/groups/export'),
+    ]
+    return [(name, in_app_context(func)) for name, func in functions] + \
+        [(name, route(path)) for name, path in routes]
+
+
+def measure(func, profile=False):
+    """
+    Run func twice, returning (seconds, peak traced bytes, output bytes, profile stats or None)
+
+    The first run is timed (and profiled if asked) and the second traced with
+    tracemalloc, since tracing every allocation slows the export down several times.
+    """
+    gc.collect()
+    profiler = cProfile.Profile() if profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        output = func()
+    finally:
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, output, pstats.Stats(profiler) if profiler else None
+
+
+def change(current, baseline):
+    """Relative change against the baseline, formatted for the table"""
+    if not baseline:
+        return '—', False
+    delta = (current - baseline) / baseline
+    return f"{delta:+.0%}", delta > REGRESSION_THRESHOLD
+
+
+def print_table(results, baseline):
+    print("\n" + "="*104)
+    print(f"{'Case':<24}{'Rows':>9}{'Time (s)':>11}{'Base':>9}{'Δ':>7}"
+          f"{'Peak MB':>10}{'Base':>9}{'Δ':>7}{'Output MB':>11}{'Rows/s':>11}")
+    print("="*104)
+
+    regressions = []
+    unmatched = []
+    for key, result in results.items():
+        previous = baseline.get(key, {})
+        if not previous:
+            unmatched.append(key)
+        time_change, slower = change(result['seconds'], previous.get('seconds'))
+        memory_change, bigger = change(result['peak_bytes'], previous.get('peak_bytes'))
+        if slower or bigger:
+            regressions.append(key)
+        print(f"{result['case']:<24}{result['rows']:>9}"
+              f"{result['seconds']:>11.2f}{_format(previous.get('seconds'), 1):>9}{time_change:>7}"
+              f"{result['peak_bytes'] / 2**20:>10.1f}{_format(previous.get('peak_bytes'), 2**20):>9}{memory_change:>7}"
+              f"{result['output_bytes'] / 2**20:>11.1f}{result['rows'] / result['seconds']:>11.0f}"
+              f"{'  ⚠️' if slower or bigger else ''}")
+
+    print("="*104)
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} case(s) more than {REGRESSION_THRESHOLD:.0%} worse than the baseline:")
+        for key in regressions:
+            print(f"  - {key}")
+    elif baseline and len(unmatched) < len(results):
+        print(f"\n✅ No regressions against the baseline in {len(results) - len(unmatched)} compared case(s)")
+    if baseline and unmatched:
+        print(f"\n⚠️  {len(unmatched)} case(s) have no baseline to compare with:")
+        for key in unmatched:
+            print(f"  - {key}")
+    return regressions
+
+
+def _format(value, unit):
+    return f"{value / unit:.2f}" if value is not None else '—'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='Comma separated group sizes to benchmark (default: 1000,10000)')
+    parser.add_argument('--photos', type=int, default=500,
+                        help='How many submissions in each group get a photo (default: 500)')
+    parser.add_argument('--cases', help='Only run cases whose name contains one of these comma separated words')
+    parser.add_argument('--profile', action='store_true', help='Print the top functions of each case by cumulative time')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results as the new baseline')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    filters = args.cases.split(',') if args.cases else None
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    workdir = tempfile.mkdtemp(prefix='webform-benchmark-')
+    try:
+        app = create_app(benchmark_config(workdir))
+        results = {}
+        failures = []
+        with app.app_context():
+            db.create_all()
+
+        for size in sizes:
+            # A user per size, so the all-groups export covers just this group
+            with app.app_context():
+                user = User(email=f'benchmark-{size}@example.com')
+                user.set_password('benchmark')
+                db.session.add(user)
+                db.session.commit()
+                print(f"\n📊 Seeding a group of {size} submissions ({min(size, args.photos)} with photos)...")
+                start = time.perf_counter()
+                group_id = seed_group(user.id, size, args.photos, app.config['UPLOAD_PATH'])
+                print(f"   done in {time.perf_counter() - start:.1f}s")
+            client = app.test_client()
+            client.post('/auth/login', data={'email': f'benchmark-{size}@example.com', 'password': 'benchmark'})
+
+            for case, func in export_cases(app, group_id, client):
+                if filters and not any(word in case for word in filters):
+                    continue
+                print(f"   ⏱  {case}...")
+                try:
+                    seconds, peak, output, stats = measure(func, args.profile)
+                except RouteError as exc:
+                    print(f"   ❌ {exc}")
+                    failures.append(f'{case} @ {size}: {exc}')
+                    continue
+                results[f'{case} @ {size}'] = {
+                    'case': case, 'rows': size, 'seconds': seconds,
+                    'peak_bytes': peak, 'output_bytes': output,
+                }
+                if stats:
+                    stats.sort_stats('cumulative').print_stats(15)
+
+        regressions = print_table(results, baseline)
+
+        if failures:
+            print(f"\n❌ {len(failures)} export route(s) failed:")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        if args.save_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump({
+                    'recorded_at': datetime.now(timezone.utc).isoformat(),
+                    'photos': args.photos,
+                    'results': results,
+                }, f, indent=2)
+            print(f"\n✅ Saved baseline to {args.baseline}")
+        elif regressions:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
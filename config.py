@@ -10,9 +10,55 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     LINK_PER_PAGE = 8
+    SUBMISSIONS_PER_PAGE = 50  # Rows of a group's submissions table
+    LAST_SEEN_INTERVAL = timedelta(minutes=5)  # A user's last_seen is written at most this often
+    LAST_SEEN_FLUSH_DELAY = 10  # Seconds visits are gathered before being written in one UPDATE
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50 MB limit for uploaded files
     UPLOAD_EXTENSIONS = ['jpg', 'jpe', 'jpeg', 'png', 'gif', 'svg', 'bmp', 'webp']
     UPLOAD_PATH = os.path.join(basedir, 'uploads')
+    UPLOAD_MAX_SIZE = MAX_CONTENT_LENGTH  # Largest photo accepted, checked while the upload is written
+    UPLOAD_GRACE_PERIOD = timedelta(minutes=10)  # Unreferenced photos stored more recently are kept
+    UPLOAD_MAX_AGE = timedelta(hours=1)  # Browsers reuse a photo this long, then revalidate it; normalizing replaces it
+    UPLOAD_OFFLOAD = os.environ.get('UPLOAD_OFFLOAD')  # Local photos sent by 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd) instead of Flask
+    UPLOAD_OFFLOAD_PREFIX = os.environ.get('UPLOAD_OFFLOAD_PREFIX') or '/protected-uploads/'  # nginx internal location aliased to UPLOAD_PATH
+    UPLOAD_KEEP_ORIGINALS = False  # Keep the unmodified upload of normalized photos in the cold tier
+    UPLOAD_ORIGINALS_PATH = os.path.join(basedir, 'originals')  # The cold tier with local storage; may be a slower disk
+    UPLOAD_STORAGE = os.environ.get('UPLOAD_STORAGE') or 'local'  # 'local' (UPLOAD_PATH) or 's3'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or 'uploads/'
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # MinIO, a local stand-in, or another S3-compatible server
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')  # boto3's usual credential lookup when unset
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    S3_ORIGINALS_PREFIX = os.environ.get('S3_ORIGINALS_PREFIX') or 'originals/'  # The cold tier with S3 storage
+    S3_ORIGINALS_STORAGE_CLASS = os.environ.get('S3_ORIGINALS_STORAGE_CLASS') or 'STANDARD_IA'
+    S3_MAX_CONNECTIONS = 20  # Pooled connections shared by every thread
+    S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # Uploads larger than this are sent in parts
+    S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    S3_URL_EXPIRY = timedelta(minutes=5)  # Lifetime of the presigned URLs photos are redirected to
+    EXPORT_STREAMING = True  # Stream group exports instead of building them in memory
+    EXPORT_BATCH_SIZE = 500  # Rows fetched per database round trip while exporting
+    EXPORT_READAHEAD = 4  # Photos read ahead on a thread pool while a ZIP export streams
+    EXPORT_PATH = os.path.join(basedir, 'exports')  # Background export job files
+    EXPORT_JOB_WORKERS = 2
+    EXPORT_JOB_TTL = timedelta(hours=24)  # Finished exports are removed after this long
+    EXPORT_CACHE_PATH = os.path.join(basedir, 'export_cache')  # Built exports reused until the group changes
+    EXPORT_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Least recently used exports are evicted past 1 GB
+    EXPORT_THUMBNAIL_SIZE = 64  # Pixels; photos embedded in the spreadsheet export are scaled to fit
+    THUMBNAIL_PATH = os.path.join(basedir, 'thumbnails')  # Cached spreadsheet thumbnails
+    IMAGE_WORKERS = None  # Processes for image work; None uses one per CPU
+    IMAGE_NORMALIZE = False  # Downscale, straighten and re-encode submitted photos (in image_worker.py)
+    IMAGE_MAX_DIMENSION = 1200  # Pixels; normalized photos are scaled down to fit
+    IMAGE_NORMALIZE_QUALITY = 85  # JPEG quality of normalized photos
+    IMAGE_DERIVATIVE_SIZES = (128, 512)  # Pixels; WebP copies made of every photo for review pages
+    IMAGE_DERIVATIVE_QUALITY = 80
+    IMAGE_DERIVATIVE_MAX_AGE = timedelta(hours=1)  # As UPLOAD_MAX_AGE, since a form's derivatives follow its photo
+    IMAGE_JOB_WORKERS = 2  # Jobs image_worker.py runs at once; the Pillow work runs on IMAGE_WORKERS processes
+    IMAGE_JOB_MAX_ATTEMPTS = 5
+    IMAGE_JOB_RETRY_DELAY = timedelta(seconds=30)  # Doubled after each failed attempt
+    IMAGE_JOB_TIMEOUT = timedelta(minutes=10)  # Running jobs older than this are presumed lost and retried
+    IMAGE_JOB_POLL_INTERVAL = 1  # Seconds an idle worker waits before looking at the queue again
+    IMAGE_JOB_TTL = timedelta(days=7)  # Finished jobs are kept this long for their timings
 
     # Session configuration for "Remember Me" functionality
     REMEMBER_COOKIE_DURATION = timedelta(days=30)  # Remember for 30 days
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Remove stored files that no submission refers to.
+
+Examples include photos whose form was never committed, derivatives of
+sizes no longer in IMAGE_DERIVATIVE_SIZES, and staged uploads left behind
+by a crash. The storage listing and the photo hashes in the database are
+both read in sorted order and merged like a join, so neither is ever held
+in memory. The cold tier of originals (UPLOAD_KEEP_ORIGINALS) is swept the
+same way.
+
+Files changed within the grace period are never touched, so uploads still
+being saved are safe. Unreferenced files are deleted, or moved to a local
+quarantine directory to be looked over first.
+
+Usage:
+    python gc_uploads.py [--dry-run] [--quarantine DIR] [--rate N] [--grace MINUTES]
+
+Examples:
+    # See what would be removed
+    python gc_uploads.py --dry-run
+
+    # Move unreferenced files aside, at most 50 a second
+    python gc_uploads.py --quarantine /var/tmp/webform-quarantine --rate 50
+"""
+
+import argparse
+import os
+import sys
+import time
+from contextlib import closing
+from itertools import chain
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import Form
+from app.uploads import uploads, LocalStorage, file_unused, hash_batches
+import sqlalchemy as sa
+
+HASH_LENGTH = 64  # Hex SHA-256
+
+
+def unreferenced_files(files, hashes, column, suffixes, batch_size):
+    """
+    Yield (key, size, modified_at, in_use) for the files that no form refers to
+
+    in_use is an EXISTS clause that would find a form referring to the file
+    after all (see collect), or None if nothing can.
+
+    files is a backend listing in key order and hashes the referenced hashes
+    in order. Sharded keys (ab/cd/<hash><suffix>) begin with their hash, so
+    the two are merged in one pass. Files directly in the root are photos
+    from before the store, named by form id, and are looked up in batches.
+    Anything else that is not a staged upload is left alone.
+    """
+    referenced = next(hashes, None)
+    legacy = []
+    for key, size, modified_at in files:
+        parts = key.split('/')
+        if len(parts) == 3:
+            image_hash, suffix = parts[2][:HASH_LENGTH], parts[2][HASH_LENGTH:]
+            while referenced is not None and referenced < image_hash:
+                referenced = next(hashes, None)
+            if suffix not in suffixes:
+                yield key, size, modified_at, None
+            elif referenced != image_hash:
+                yield key, size, modified_at, sa.exists().where(column == image_hash)
+        elif len(parts) == 2 and parts[0] == '.staging':
+            yield key, size, modified_at, None
+        elif len(parts) == 1:
+            legacy.append((key, size, modified_at))
+            if len(legacy) == batch_size:
+                yield from unreferenced_legacy_files(legacy)
+                legacy = []
+    yield from unreferenced_legacy_files(legacy)
+
+
+def unreferenced_legacy_files(files):
+    if not files:
+        return
+    form_ids = set(db.session.scalars(sa.select(Form.id).where(Form.id.in_([key for key, _, _ in files]))))
+    for key, size, modified_at in files:
+        if key not in form_ids:
+            yield key, size, modified_at, sa.exists().where(Form.id == key)
+
+
+def collect(backend, unreferenced, grace_period, quarantine, rate, dry_run):
+    """
+    Delete or quarantine the unreferenced files older than grace_period; returns (count, bytes)
+
+    The listing can be minutes old by the time a file comes up, and an
+    identical upload may have taken the file back since, so each one is
+    checked again (file_unused) just before it goes.
+    """
+    removed = 0
+    removed_bytes = 0
+    interval = 1 / rate if rate else 0
+    next_at = time.monotonic()
+    for key, size, modified_at, in_use in unreferenced:
+        if time.time() - modified_at < grace_period:
+            continue
+        if dry_run:
+            removed += 1
+            removed_bytes += size
+            print(f"  - {key} ({size / 1024:.0f} KB)")
+            continue
+
+        if interval:
+            # Spread the load on the storage out evenly
+            time.sleep(max(0, next_at - time.monotonic()))
+            next_at = max(next_at, time.monotonic()) + interval
+        if not file_unused(backend, key, in_use, grace_period):
+            continue
+        removed += 1
+        removed_bytes += size
+        if quarantine is not None:
+            path = backend.local_path(key)
+            if path is not None:
+                quarantine.store_file(key, path)
+                continue
+            f = backend.open(key)
+            if f is None:
+                continue
+            with closing(f):
+                quarantine.save(key, f)
+            # The download took a while; keep the original if it was taken back meanwhile
+            if not file_unused(backend, key, in_use, grace_period):
+                continue
+        backend.delete(key)
+    return removed, removed_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='List the files that would be removed')
+    parser.add_argument('--quarantine', metavar='DIR', help='Move unreferenced files here instead of deleting them')
+    parser.add_argument('--rate', type=float, help='Remove at most this many files a second')
+    parser.add_argument('--grace', type=float, metavar='MINUTES',
+                        help='Keep files changed more recently than this (default: UPLOAD_GRACE_PERIOD)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows fetched per database round trip')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("\n" + "="*80)
+        print("UPLOAD STORE GARBAGE COLLECTION" + (" (DRY RUN)" if args.dry_run else ""))
+        print("="*80)
+
+        grace_period = args.grace * 60 if args.grace is not None \
+            else app.config['UPLOAD_GRACE_PERIOD'].total_seconds()
+        derivative_suffixes = {''} | {f'_{size}.webp' for size in app.config['IMAGE_DERIVATIVE_SIZES']}
+        tiers = [('photos', uploads.backend, Form.image_hash, derivative_suffixes, '')]
+        if uploads.cold_backend is not None:
+            tiers.append(('originals', uploads.cold_backend, Form.image_original_hash, {''}, 'originals/'))
+
+        print(f"\n📊 Grace period: {grace_period / 60:.0f} minutes")
+        start = time.perf_counter()
+        for name, backend, column, suffixes, quarantine_prefix in tiers:
+            quarantine = None
+            if args.quarantine:
+                quarantine = LocalStorage(os.path.join(args.quarantine, quarantine_prefix))
+            referenced = chain.from_iterable(hash_batches(column, args.batch_size))
+            unreferenced = unreferenced_files(backend.list_files(), referenced, column, suffixes, args.batch_size)
+            removed, removed_bytes = collect(backend, unreferenced, grace_period, quarantine,
+                                             args.rate, args.dry_run)
+            action = 'Would remove' if args.dry_run else 'Quarantined' if quarantine else 'Deleted'
+            print(f"\n✅ {action} {removed} unreferenced {name} ({removed_bytes / 1024 / 1024:.1f} MB)")
+        print(f"✅ Done in {time.perf_counter() - start:.1f}s")
+
+        print("\n" + "="*80)
+
+
+if __name__ == '__main__':
+    main()
@@ -25,12 +25,14 @@ import random
 from datetime import datetime, timedelta, timezone
 from PIL import Image, ImageDraw, ImageFont
 import io
+import hashlib
 
 # Add the app to the path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from app import db, create_app
 from app.models import Form, Link, Group, User
+from app.uploads import blob_path
 import secrets
 
 # Sample data for realistic fake people
@@ -122,8 +124,13 @@ def generate_fake_image(first_name, last_name, gender):
     img_bytes.seek(0)
     return img_bytes
 
-def generate_fake_person(link_id, group_id=None):
-    """Generate a single fake person with realistic data"""
+def generate_fake_person(link_id, group_id=None, upload_path=None, photo=True):
+    """
+    Generate a single fake person with realistic data
+
+    The photo is written to upload_path (the app's uploads folder by default);
+    pass photo=False to skip it when seeding large groups.
+    """
     # Randomly select gender
     gender = random.choice(['Male', 'Female'])
     
@@ -191,12 +198,22 @@ def generate_fake_person(link_id, group_id=None):
         submitted_at=datetime.now(timezone.utc)
     )
     
+    if not photo:
+        return form
+
     # Generate and save fake image
     img_bytes = generate_fake_image(first_name, last_name, gender)
-    upload_path = os.path.join(os.path.dirname(__file__), 'uploads')
-    os.makedirs(upload_path, exist_ok=True)
-    
-    with open(os.path.join(upload_path, form_id), 'wb') as f:
+    if upload_path is None:
+        upload_path = os.path.join(os.path.dirname(__file__), 'uploads')
+
+    form.image_mime = 'image/png'
+    form.image_extension = 'png'
+    form.image_size = len(img_bytes.getvalue())
+    form.image_hash = hashlib.sha256(img_bytes.getvalue()).hexdigest()
+
+    path = blob_path(upload_path, form.image_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
         f.write(img_bytes.getvalue())
     
     return form
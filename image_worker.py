@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+Run queued image jobs (derivatives and other Pillow work on stored photos).
+
+Submissions only store the photo and queue an ImageJob; this worker claims
+jobs from the queue table, runs IMAGE_JOB_WORKERS of them at a time with the
+image work on a process pool, retries failures with backoff, and records how
+long each job waited and ran. Start as many workers as you like, on any
+machine that shares the database and upload storage.
+
+Usage:
+    python image_worker.py [--threads N] [--once]
+    python image_worker.py --stats
+
+Examples:
+    # Work the queue until interrupted
+    python image_worker.py
+
+    # Drain the queue and exit
+    python image_worker.py --once
+
+    # Show queue depth and job timings, to size the pool
+    python image_worker.py --stats
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+# Add the app to the path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import ImageJob
+from app.images import process_pool
+from app.image_jobs import claim_image_job, run_image_job, requeue_stalled_jobs, prune_image_jobs
+import sqlalchemy as sa
+
+MAINTENANCE_INTERVAL = 60  # Seconds between looking for stalled and old jobs
+
+
+def work(app, name, pool, once, stop):
+    """Claim and run jobs until stopped (or, with once, until the queue is empty)"""
+    with app.app_context():
+        while not stop.is_set():
+            job = claim_image_job(name)
+            if job is None:
+                if once:
+                    return
+                stop.wait(app.config['IMAGE_JOB_POLL_INTERVAL'])
+                continue
+
+            try:
+                job = run_image_job(job, pool)
+            except Exception:
+                # Lost the database for a moment; the job is retried once IMAGE_JOB_TIMEOUT passes
+                app.logger.exception('Image worker %s could not record job %s', name, job.id)
+                db.session.rollback()
+                continue
+            mark = '✓' if job.status == 'done' else '↻' if job.status == 'queued' else '✗'
+            print(f"  {mark} {job.kind} {job.image_hash[:12]} (attempt {job.attempts}) "
+                  f"waited {job.wait_seconds:.2f}s, ran {job.run_seconds:.2f}s"
+                  + (f" — {job.error}" if job.error else ''))
+        db.session.remove()
+
+
+def print_stats(app, recent=1000):
+    with app.app_context():
+        print("\n" + "="*80)
+        print("IMAGE JOB QUEUE")
+        print("="*80)
+
+        counts = db.session.execute(
+            sa.select(ImageJob.kind, ImageJob.status, sa.func.count(ImageJob.id))
+            .group_by(ImageJob.kind, ImageJob.status)
+            .order_by(ImageJob.kind, ImageJob.status)
+        ).all()
+        if not counts:
+            print("\nNo jobs.")
+        for kind, status, count in counts:
+            print(f"  {kind:<14} {status:<8} {count:>8}")
+
+        finished = db.session.execute(
+            sa.select(ImageJob.kind, ImageJob.wait_seconds, ImageJob.run_seconds)
+            .where(ImageJob.status == 'done')
+            .order_by(ImageJob.finished_at.desc())
+            .limit(recent)
+        ).all()
+        if finished:
+            print(f"\n📊 Timings of the last {len(finished)} finished jobs (seconds):")
+            print(f"  {'':<14} {'':<5} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}")
+            for kind in sorted({row.kind for row in finished}):
+                for label, values in (('wait', [row.wait_seconds for row in finished if row.kind == kind]),
+                                      ('run', [row.run_seconds for row in finished if row.kind == kind])):
+                    values = sorted(value for value in values if value is not None)
+                    if not values:
+                        continue
+                    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+                    print(f"  {kind:<14} {label:<5} {statistics.mean(values):>8.2f} "
+                          f"{statistics.median(values):>8.2f} {p95:>8.2f} {values[-1]:>8.2f}")
+            print("\nLong waits with short runs mean the pool is too small.")
+
+        print("\n" + "="*80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, help='Jobs to run at once (default: IMAGE_JOB_WORKERS)')
+    parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+    parser.add_argument('--stats', action='store_true', help='Print queue depth and job timings, then exit')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.stats:
+        print_stats(app)
+        return
+
+    threads = args.threads or app.config['IMAGE_JOB_WORKERS']
+    pool = process_pool(app.config['IMAGE_WORKERS'])
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    stop = threading.Event()
+
+    with app.app_context():
+        requeue_stalled_jobs()
+
+    print(f"\n🖼  Image worker {prefix} running {threads} jobs at a time")
+    workers = [
+        threading.Thread(target=work, args=(app, f'{prefix}:{i}', pool, args.once, stop), daemon=True)
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        last_maintenance = time.monotonic()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(0.5)
+            if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+                with app.app_context():
+                    requeued = requeue_stalled_jobs()
+                    pruned = prune_image_jobs()
+                    db.session.remove()
+                if requeued or pruned:
+                    print(f"  {requeued} stalled jobs retried, {pruned} old jobs removed")
+    except KeyboardInterrupt:
+        print("\nStopping after the running jobs finish...")
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Move photos from the flat UPLOAD_PATH/<form id> layout into the
+content-addressed store (UPLOAD_PATH/ab/cd/<sha256>).
+
+Forms without stored image metadata get it filled in on the way. Identical
+photos are kept once. Files that belong to no form are left where they are
+and listed. The move is a rename within UPLOAD_PATH, and the app finds photos
+in either layout, so the script can run while the app is up and be re-run.
+Only needed with the local storage backend (UPLOAD_STORAGE = 'local').
+
+Usage: python migrate_uploads.py [batch_size]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import Form
+from app.uploads import blob_path, file_metadata
+import sqlalchemy as sa
+
+
+def legacy_files(upload_path, batch_size):
+    """Yield lists of up to batch_size (name, path) for the files directly in upload_path"""
+    batch = []
+    for entry in os.scandir(upload_path):
+        if entry.is_file() and not entry.name.endswith('.part'):
+            batch.append((entry.name, entry.path))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+app = create_app()
+
+with app.app_context():
+    print("\n" + "="*80)
+    print("MIGRATE UPLOADS TO THE CONTENT-ADDRESSED STORE")
+    print("="*80)
+
+    upload_path = app.config['UPLOAD_PATH']
+    moved = 0
+    duplicates = 0
+    orphaned = []
+
+    for batch in legacy_files(upload_path, batch_size):
+        hashes = dict(db.session.execute(
+            sa.select(Form.id, Form.image_hash).where(Form.id.in_([name for name, _ in batch]))
+        ).all())
+
+        # Record the hashes first, so the app can find each photo before and after it moves
+        values = []
+        for form_id, path in batch:
+            if form_id not in hashes:
+                orphaned.append(form_id)
+            elif not hashes[form_id]:
+                metadata = file_metadata(path)
+                if metadata is not None:
+                    hashes[form_id] = metadata['image_hash']
+                    values.append({'id': form_id, **metadata})
+        if values:
+            db.session.execute(sa.update(Form), values)
+        db.session.commit()
+
+        for form_id, path in batch:
+            if not hashes.get(form_id):
+                continue
+            target = blob_path(upload_path, hashes[form_id])
+            if os.path.exists(target):
+                os.remove(path)
+                duplicates += 1
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+                moved += 1
+        print(f"  ✓ {moved} moved, {duplicates} duplicates removed")
+
+    print(f"\n✅ Moved {moved} photos into the store")
+    print(f"✅ Removed {duplicates} duplicate copies")
+    if orphaned:
+        print(f"⚠️  {len(orphaned)} files belong to no form and were left in place:")
+        for name in orphaned[:20]:
+            print(f"  - {name}")
+        if len(orphaned) > 20:
+            print(f"  ... and {len(orphaned) - 20} more")
+
+    print("\n" + "="*80)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Normalize photos stored before IMAGE_NORMALIZE was turned on: scale them
+down to fit IMAGE_MAX_DIMENSION, apply their EXIF orientation and re-encode
+them at IMAGE_NORMALIZE_QUALITY, as new submissions are.
+
+Every distinct stored photo is visited once, in batches ordered by hash, and
+gets the same 'normalize' ImageJob a new submission does; image_worker.py
+runs them. The forms using a photo are pointed at its normalized copy,
+derivatives are queued, and the original is kept in the cold tier with
+UPLOAD_KEEP_ORIGINALS or else released once UPLOAD_GRACE_PERIOD has passed.
+Photos that would not shrink are left alone, so the script can be re-run.
+Turn IMAGE_NORMALIZE on first, so new submissions are normalized too.
+
+Usage: python normalize_uploads.py [batch_size]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app, db
+from app.models import Form, ImageJob
+from app.uploads import hash_batches
+import sqlalchemy as sa
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    app = create_app()
+
+    with app.app_context():
+        print("\n" + "="*80)
+        print("NORMALIZE STORED PHOTOS")
+        print("="*80)
+
+        print(f"\n📊 Largest dimension: {app.config['IMAGE_MAX_DIMENSION']}px, "
+              f"JPEG quality {app.config['IMAGE_NORMALIZE_QUALITY']}")
+        print(f"📊 Originals: {'kept in the cold tier' if app.config['UPLOAD_KEEP_ORIGINALS'] else 'removed'}")
+        queued = 0
+        for hashes in hash_batches(Form.image_hash, batch_size):
+            # Photos already waiting for a normalize job are not queued twice
+            pending = set(db.session.scalars(
+                sa.select(ImageJob.image_hash)
+                .where(ImageJob.kind == 'normalize', ImageJob.status.in_(['queued', 'running']),
+                       ImageJob.image_hash.in_(hashes))
+            ))
+            jobs = [{'kind': 'normalize', 'image_hash': image_hash} for image_hash in hashes if image_hash not in pending]
+            if jobs:
+                db.session.execute(sa.insert(ImageJob), jobs)
+                db.session.commit()
+            queued += len(jobs)
+            print(f"  ✓ {queued} photos queued")
+
+        print(f"\n✅ Queued {queued} photos for image_worker.py")
+        print("✅ Follow the progress with: python image_worker.py --stats")
+
+        print("\n" + "="*80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Stress the group capacity limit with parallel submissions and deletions.
+
+A throwaway group is given a capacity, and more submissions than it can hold
+are posted through the form page at once from many threads. Afterwards the
+group must have accepted exactly its capacity, and its current_count must
+match the submissions actually stored. Half of them are then deleted in
+parallel while more are posted, and the count is checked again. Request
+latencies are reported so a lock convoy (every request waiting on the one
+before it) shows up as a long tail, and any request that failed, such as on
+"database is locked", fails the run.
+
+The database and upload folder live in a temporary directory, so real data is
+never touched. Pass --database-url to run against a scratch PostgreSQL or
+MySQL database instead of SQLite.
+
+Usage:
+    python stress_capacity.py [--submissions N] [--capacity N] [--threads N]
+                              [--database-url URL] [--max-latency SECONDS]
+
+Examples:
+    # 400 submissions from 32 threads into a group of 250
+    python stress_capacity.py
+
+    # Against PostgreSQL
+    python stress_capacity.py --database-url postgresql://localhost/webform_stress
+"""
+
+import argparse
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# Add the app to the path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from config import Config
+from app import db, create_app
+from app.models import Form, Link, Group, User
+from app.deletions import delete_forms
+from PIL import Image
+import sqlalchemy as sa
+
+
+def stress_config(workdir, database_url):
+    """A config that keeps the database and every data folder inside workdir"""
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///' + os.path.join(workdir, 'stress.db')
+        UPLOAD_PATH = os.path.join(workdir, 'uploads')
+        UPLOAD_ORIGINALS_PATH = os.path.join(workdir, 'originals')
+        EXPORT_PATH = os.path.join(workdir, 'exports')
+        EXPORT_CACHE_PATH = os.path.join(workdir, 'export_cache')
+        THUMBNAIL_PATH = os.path.join(workdir, 'thumbnails')
+        WTF_CSRF_ENABLED = False
+    return StressConfig
+
+
+def photo_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (120, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def submit(app, link_id, photo, i):
+    """Post one submission; returns (outcome, seconds)"""
+    data = {
+        'first_name': f'Stress{i}', 'last_name': 'Test', 'eye_color': 'blue', 'hair_color': 'brown',
+        'date_of_birth': '1990-01-01', 'height': '180', 'weight': '75', 'gender': 'male',
+        'state': 'MN', 'city': 'Minneapolis', 'zip_code': '55401',
+        'image': (io.BytesIO(photo), 'photo.png'),
+    }
+    start = time.perf_counter()
+    response = app.test_client().post(f'/form/{link_id}', data=data, content_type='multipart/form-data')
+    seconds = time.perf_counter() - start
+    if response.status_code == 302:
+        return 'accepted', seconds
+    if response.status_code == 200 and b'capacity limit' in response.data:
+        return 'full', seconds
+    return f'HTTP {response.status_code}', seconds
+
+
+def delete(app, user_id, form_id):
+    start = time.perf_counter()
+    with app.app_context():
+        try:
+            deleted, _ = delete_forms(db.session.get(User, user_id), form_ids=[form_id])
+            return ('deleted' if deleted else 'missing'), time.perf_counter() - start
+        except Exception as exc:
+            return f'{type(exc).__name__}: {exc}', time.perf_counter() - start
+        finally:
+            db.session.remove()
+
+
+def run(pool, tasks):
+    """Start every task at once; returns the outcome counts, latencies and wall time"""
+    start = time.perf_counter()
+    results = [future.result() for future in [pool.submit(*task) for task in tasks]]
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes, sorted(seconds for _, seconds in results), time.perf_counter() - start
+
+
+def report(name, outcomes, latencies, wall):
+    """Print a phase's outcomes and latencies; returns (failed requests, slowest seconds)"""
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"\n📊 {name}: {len(latencies)} requests in {wall:.2f}s ({len(latencies) / wall:.0f}/s)")
+    print("   " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+    print(f"   latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"p95 {p95 * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    failed = sum(count for outcome, count in outcomes.items() if outcome not in ('accepted', 'full', 'deleted'))
+    return failed, latencies[-1]
+
+
+def check_count(group_id, expected):
+    """Compare the group's current_count with its stored submissions; returns whether all agree"""
+    db.session.expire_all()
+    count = db.session.scalar(sa.select(Group.current_count).where(Group.id == group_id))
+    stored = db.session.scalar(sa.select(sa.func.count(Form.id)).where(Form.group_id == group_id))
+    ok = count == stored == expected
+    print(f"   {'✅' if ok else '❌'} current_count {count}, stored {stored}, expected {expected}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=400, help='Submissions posted at once (default: 400)')
+    parser.add_argument('--capacity', type=int, default=250, help="The group's max_capacity (default: 250)")
+    parser.add_argument('--threads', type=int, default=32, help='Requests in flight at once (default: 32)')
+    parser.add_argument('--database-url', help='Scratch database to use instead of a temporary SQLite file')
+    parser.add_argument('--max-latency', type=float, default=5.0,
+                        help='Fail if any request takes longer than this many seconds (default: 5)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='webform-stress-')
+    try:
+        app = create_app(stress_config(workdir, args.database_url))
+        with app.app_context():
+            print("\n" + "="*80)
+            print("GROUP CAPACITY STRESS TEST")
+            print("="*80)
+
+            db.create_all()
+            user = User(email=f'stress-{time.time_ns()}@example.com')
+            group = Group(name='Capacity stress', creator=user, max_capacity=args.capacity)
+            now = datetime.now(timezone.utc)
+            link = Link(created_at=now, end_at=now + timedelta(days=1), creator=user, group=group)
+            db.session.add_all([user, group, link])
+            db.session.commit()
+            user_id, group_id, link_id = user.id, group.id, link.id
+
+            photo = photo_bytes()
+            ok = True
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                outcomes, latencies, wall = run(pool, [(submit, app, link_id, photo, i)
+                                                       for i in range(args.submissions)])
+                failed, slowest = report('Parallel submissions', outcomes, latencies, wall)
+                expected = min(args.submissions, args.capacity)
+                ok &= outcomes.get('accepted', 0) == expected
+                ok &= check_count(group_id, expected)
+
+                # Free half the places while more submissions compete for them
+                form_ids = db.session.scalars(sa.select(Form.id).where(Form.group_id == group_id)).all()
+                doomed = form_ids[:len(form_ids) // 2]
+                tasks = [(delete, app, user_id, form_id) for form_id in doomed] + \
+                        [(submit, app, link_id, photo, args.submissions + i) for i in range(len(doomed))]
+                outcomes, latencies, wall = run(pool, tasks)
+                more_failed, more_slowest = report('Parallel deletions and submissions', outcomes, latencies, wall)
+                failed, slowest = failed + more_failed, max(slowest, more_slowest)
+                stored = db.session.scalar(sa.select(sa.func.count(Form.id)).where(Form.group_id == group_id))
+                ok &= outcomes.get('deleted', 0) == len(doomed)
+                ok &= stored <= args.capacity
+                ok &= check_count(group_id, stored)
+
+            if failed:
+                print(f"\n❌ {failed} requests failed")
+            if slowest > args.max_latency:
+                print(f"\n❌ The slowest request took {slowest:.1f}s, over {args.max_latency:.1f}s")
+                ok = False
+            print(f"\n{'✅ Capacity held exactly' if ok and not failed else '❌ Capacity check failed'}")
+            print("\n" + "="*80)
+        sys.exit(0 if ok and not failed else 1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from app import create_app, db
 from app.models import Form, Group
+from app.uploads import uploads
 import sqlalchemy as sa
 import zipfile
 import io
@@ -48,8 +49,8 @@ with app.app_context():
     forms_without_images = 0
     
     for form in forms:
-        image_path = os.path.join(upload_path, form.id)
-        if os.path.exists(image_path):
+        image_path = uploads.path(form)
+        if image_path:
             forms_with_images += 1
             file_size = os.path.getsize(image_path)
             kind = filetype.guess(image_path)
@@ -57,7 +58,7 @@ with app.app_context():
             print(f"   ✅ {form.first_name} {form.last_name}: {file_size} bytes ({ext})")
         else:
             forms_without_images += 1
-            print(f"   ❌ {form.first_name} {form.last_name}: IMAGE NOT FOUND at {image_path}")
+            print(f"   ❌ {form.first_name} {form.last_name}: IMAGE NOT FOUND for {form.id}")
     
     print(f"\n📊 Summary:")
     print(f"   Forms with images: {forms_with_images}")
@@ -75,9 +76,9 @@ with app.app_context():
     try:
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
             for form in forms:
-                image_path = os.path.join(upload_path, form.id)
+                image_path = uploads.path(form)
                 
-                if os.path.exists(image_path):
+                if image_path:
                     # Create filename
                     filename = f"{form.first_name}_{form.last_name}_{form.id[:8]}"
                     
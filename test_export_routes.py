@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Test script to verify the group export routes end to end.
+
+Every export is requested through the app's test client with no app context
+held around the request, as under a real server: the view's database session
+is closed by the time a streamed body is sent, so a body that still reads
+rows through it fails here too. The whole body of each response is read and
+opened, workbooks with openpyxl and archives with zipfile.
+
+The database and every data folder live in a temporary directory, so real
+data is never touched.
+
+Usage:
+    python test_export_routes.py
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from config import Config
+from app import create_app, db
+from app.models import User, Group, Link
+from openpyxl import load_workbook
+from PIL import Image
+
+SUBMISSIONS = 5
+
+
+def export_test_config(workdir):
+    """A config that keeps the database and every data folder inside workdir"""
+    class ExportTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'app.db')
+        UPLOAD_PATH = os.path.join(workdir, 'uploads')
+        UPLOAD_ORIGINALS_PATH = os.path.join(workdir, 'originals')
+        EXPORT_PATH = os.path.join(workdir, 'exports')
+        EXPORT_CACHE_PATH = os.path.join(workdir, 'export_cache')
+        THUMBNAIL_PATH = os.path.join(workdir, 'thumbnails')
+        WTF_CSRF_ENABLED = False
+    return ExportTestConfig
+
+
+def photo(i):
+    buffer = io.BytesIO()
+    Image.new('RGB', (120, 90), (i * 40 % 256, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def submit(client, link_id, i):
+    data = {
+        'first_name': f'Export{i}', 'last_name': 'Test', 'eye_color': 'blue', 'hair_color': 'brown',
+        'date_of_birth': '1990-01-01', 'height': '180', 'weight': '75', 'gender': 'male',
+        'state': 'MN', 'city': 'Minneapolis', 'zip_code': '55401',
+        'image': (io.BytesIO(photo(i)), 'photo.png'),
+    }
+    return client.post(f'/form/{link_id}', data=data, content_type='multipart/form-data')
+
+
+def fetch(client, url):
+    """GET url and read the whole body; returns (status, headers, body), status None if streaming failed"""
+    try:
+        response = client.get(url)
+        return response.status_code, response.headers, response.get_data()
+    except Exception as exc:
+        print(f"   💥 {url}: {type(exc).__name__}: {exc}")
+        return None, {}, b''
+
+
+def sheet_rows(body, title=None):
+    """Data rows (without the header) of a workbook's sheet, the first one unless title is given"""
+    wb = load_workbook(io.BytesIO(body), read_only=True)
+    ws = wb[title] if title else wb.worksheets[0]
+    return list(ws.iter_rows(min_row=2, values_only=True))
+
+
+def check(label, ok):
+    print(f"   {'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='webform-exports-')
+    ok = True
+    try:
+        app = create_app(export_test_config(workdir))
+        with app.app_context():
+            db.create_all()
+            user = User(email='exports@example.com')
+            user.set_password('export-test')
+            group = Group(name='Export routes', creator=user)
+            now = datetime.now(timezone.utc)
+            link = Link(created_at=now, end_at=now + timedelta(days=1), creator=user, group=group)
+            db.session.add_all([user, group, link])
+            db.session.commit()
+            group_id, link_id = group.id, link.id
+
+        print("\n" + "="*80)
+        print("TESTING EXPORT ROUTES")
+        print("="*80)
+
+        client = app.test_client()
+        for i in range(SUBMISSIONS):
+            submit(client, link_id, i)
+        client.post('/auth/login', data={'email': 'exports@example.com', 'password': 'export-test'})
+
+        print("\n📦 Spreadsheet export...")
+        status, _, body = fetch(client, f'/group/{group_id}/export')
+        ok &= check(f"HTTP {status}", status == 200)
+        ok &= check("every submission in the workbook", status == 200 and len(sheet_rows(body)) == SUBMISSIONS)
+
+        print("\n📦 Spreadsheet export with photos...")
+        status, _, body = fetch(client, f'/group/{group_id}/export?format=xlsx_photos')
+        ok &= check(f"HTTP {status}", status == 200)
+        if status == 200:
+            ok &= check("every submission in the workbook", len(sheet_rows(body)) == SUBMISSIONS)
+            with zipfile.ZipFile(io.BytesIO(body)) as workbook:
+                images = [name for name in workbook.namelist() if name.startswith('xl/media/')]
+            ok &= check(f"{len(images)} thumbnails embedded", len(images) == SUBMISSIONS)
+
+        print("\n📦 CSV and JSON Lines exports...")
+        for kind in ('csv', 'ndjson'):
+            status, _, body = fetch(client, f'/group/{group_id}/export?format={kind}')
+            lines = body.decode('utf-8').splitlines()
+            expected = SUBMISSIONS + 1 if kind == 'csv' else SUBMISSIONS
+            ok &= check(f"{kind}: HTTP {status}, {len(lines)} lines", status == 200 and len(lines) == expected)
+
+        print("\n📦 Incremental exports after a deletion...")
+        status, headers, body = fetch(client, f'/group/{group_id}/export?since=')
+        rows = sheet_rows(body) if status == 200 else []
+        ok &= check(f"everything so far: HTTP {status}, {len(rows)} submissions", len(rows) == SUBMISSIONS)
+        cursor = headers.get('X-Export-Cursor', '')
+        deleted_id = rows[0][-1] if rows else None
+        client.post('/forms/delete', json={'form_ids': [deleted_id]})
+        submit(client, link_id, SUBMISSIONS)
+
+        status, _, body = fetch(client, f'/group/{group_id}/export?since={cursor}')
+        ok &= check(f"spreadsheet since the cursor: HTTP {status}", status == 200)
+        if status == 200:
+            ok &= check("one submission added", len(sheet_rows(body)) == 1)
+            ok &= check("the deleted one listed", [row[0] for row in sheet_rows(body, 'Deleted')] == [deleted_id])
+        status, _, body = fetch(client, f'/group/{group_id}/export-photos?since={cursor}')
+        ok &= check(f"photos since the cursor: HTTP {status}", status == 200)
+        if status == 200:
+            with zipfile.ZipFile(io.BytesIO(body)) as archive:
+                names = archive.namelist()
+                ok &= check("one photo added", len(names) == 2 and names[-1] == 'deleted.txt')
+                ok &= check("the deleted one listed", archive.read('deleted.txt').decode() == f'{deleted_id}\n')
+
+        print("\n📦 Background export served from the cache...")
+        status, _, _ = fetch(client, f'/group/{group_id}/export')
+        ok &= check(f"export cached: HTTP {status}", status == 200)
+        job = client.post(f'/group/{group_id}/export-jobs', data={'kind': 'xlsx'}).get_json()
+        for _ in range(100):
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.1)
+            job = client.get(job['status_url']).get_json()
+        ok &= check(f"job {job['status']}", job['status'] == 'done')
+        ok &= check(f"{job['rows_done']} of {job['rows_total']} rows reported done",
+                    job['rows_total'] == job['rows_done'] == SUBMISSIONS)
+        status, _, body = fetch(client, job['download_url'] or '')
+        ok &= check("download complete", status == 200 and len(sheet_rows(body)) == SUBMISSIONS)
+
+        print(f"\n{'✅ Export routes work' if ok else '❌ Export route check failed'}")
+        print("\n" + "="*80)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
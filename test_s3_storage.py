@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Test script to verify the S3 upload backend against a local stand-in server.
+
+Starts moto's S3 server on a free local port (pip install -r requirements-dev.txt),
+or uses the server at S3_ENDPOINT_URL when that is set, e.g. a MinIO container.
+A throwaway bucket is created and photos go through the same calls the app
+makes: staging and saving a submission, deduplication, presigned URLs,
+multipart uploads, the cold tier, listing for gc_uploads.py and release.
+
+Usage:
+    python test_s3_storage.py
+
+    # Against MinIO instead of moto
+    S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_ACCESS_KEY_ID=minioadmin \\
+        S3_SECRET_ACCESS_KEY=minioadmin python test_s3_storage.py
+"""
+
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import timedelta
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from config import Config
+from app import create_app, db
+from app.uploads import uploads, blob_key
+from PIL import Image
+import boto3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_moto():
+    """Run moto's S3 server in the background; returns (process, endpoint URL)"""
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'moto.server', '-p', str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            break
+        except OSError:
+            time.sleep(0.2)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def photo(size=(400, 300), color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def check(label, ok):
+    print(f"   {'✅' if ok else '❌'} {label}")
+    return ok
+
+
+def main():
+    server = None
+    endpoint = os.environ.get('S3_ENDPOINT_URL')
+    if not endpoint:
+        server, endpoint = start_moto()
+    bucket = f'webform-test-{int(time.time())}'
+    workdir = tempfile.mkdtemp(prefix='webform-s3-')
+
+    class S3TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'app.db')
+        EXPORT_PATH = os.path.join(workdir, 'exports')
+        EXPORT_CACHE_PATH = os.path.join(workdir, 'export_cache')
+        THUMBNAIL_PATH = os.path.join(workdir, 'thumbnails')
+        UPLOAD_STORAGE = 's3'
+        UPLOAD_KEEP_ORIGINALS = True
+        S3_BUCKET = bucket
+        S3_ENDPOINT_URL = endpoint
+        S3_REGION = os.environ.get('S3_REGION') or 'us-east-1'
+        S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID') or 'test'
+        S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY') or 'test'
+        S3_MULTIPART_THRESHOLD = 5 * 1024 * 1024  # S3's smallest part size
+        S3_MULTIPART_CHUNKSIZE = 5 * 1024 * 1024
+        UPLOAD_GRACE_PERIOD = timedelta(0)
+
+    ok = True
+    try:
+        boto3.client('s3', endpoint_url=endpoint, region_name=S3TestConfig.S3_REGION,
+                     aws_access_key_id=S3TestConfig.S3_ACCESS_KEY_ID,
+                     aws_secret_access_key=S3TestConfig.S3_SECRET_ACCESS_KEY).create_bucket(Bucket=bucket)
+        app = create_app(S3TestConfig)
+        with app.app_context():
+            db.create_all()
+            print("\n" + "="*80)
+            print(f"TESTING S3 STORAGE ({endpoint}, bucket {bucket})")
+            print("="*80)
+            backend = uploads.backend
+
+            print("\n📦 Saving a submission's photo...")
+            data = photo()
+            staged = uploads.stage(io.BytesIO(data), Config.UPLOAD_EXTENSIONS, Config.MAX_CONTENT_LENGTH)
+            key = uploads.save(staged)
+            ok &= check(f"stored at {key}", backend.exists(key))
+            with backend.open(key) as f:
+                ok &= check("read back intact", f.read() == data)
+            ok &= check("staged file removed", not os.path.exists(staged.path))
+
+            before = backend.modified_at(key)
+            time.sleep(1.1)
+            staged = uploads.stage(io.BytesIO(data), Config.UPLOAD_EXTENSIONS, Config.MAX_CONTENT_LENGTH)
+            ok &= check("identical photo deduplicated", uploads.save(staged) == key)
+            ok &= check("its modification time bumped", backend.modified_at(key) > before)
+
+            url = backend.url(key, 'image/png', 'attachment; filename="photo.png"')
+            with urllib.request.urlopen(url) as response:
+                ok &= check("presigned URL serves the photo",
+                            response.read() == data and response.headers['Content-Type'] == 'image/png')
+
+            print("\n📦 Multipart upload...")
+            buffer = io.BytesIO()
+            Image.effect_noise((2200, 1800), 100).convert('RGB').save(buffer, 'BMP')
+            big = buffer.getvalue()
+            staged = uploads.stage(io.BytesIO(big), ['bmp'], 50 * 1024 * 1024)
+            big_key = uploads.save(staged)
+            with backend.open(big_key) as f:
+                ok &= check(f"{len(big) / 1024 / 1024:.1f} MB photo stored", f.read() == big)
+
+            print("\n📦 Cold tier...")
+            cold = uploads.cold_backend
+            cold.save(blob_key('ee' * 32), io.BytesIO(b'original'), 'image/jpeg')
+            ok &= check("original stored under S3_ORIGINALS_PREFIX", cold.exists(blob_key('ee' * 32)))
+
+            print("\n📦 Listing and release...")
+            keys = [listed for listed, _, _ in backend.list_files()]
+            ok &= check("listing in key order", keys == sorted(keys) and key in keys and big_key in keys)
+            uploads.release_many([(None, staged.image_hash, 'ee' * 32)])
+            ok &= check("unreferenced photos released", not backend.exists(big_key))
+            ok &= check("unreferenced original released", not cold.exists(blob_key('ee' * 32)))
+
+            print(f"\n{'✅ S3 storage works' if ok else '❌ S3 storage check failed'}")
+            print("\n" + "="*80)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.terminate()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()